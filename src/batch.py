@@ -0,0 +1,108 @@
+'''Headless batch conversion of recorded sketches to SwiftUI.
+
+Reads a JSON list or a JSONL file of sketches and writes one JSON line per
+sketch, in input order, as soon as it is done. A sketch is either a list of
+views or an object {"id": ..., "views": [...]}; views are written as
+View.to_dict does, root first. Does not import tkinter or pyperclip.
+
+    python batch.py sketches.jsonl -o swiftui.jsonl --workers 8
+'''
+from view import *
+from hierarchy import *
+from collections import deque
+import argparse
+import json
+import sys
+import time
+
+def read_sketches(f):
+    '''Yields (id, views) pairs from an open JSON or JSONL file. The text is
+    read as one JSON document if it is one, else as one sketch per line.
+    '''
+    text = f.read()
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError:
+        # JSONL, whose text also starts with '[' when the lines are view lists
+        entries = (json.loads(line) for line in text.splitlines() if line.strip())
+    else:
+        # A JSONL file of one line is one JSON document, a single sketch
+        if isinstance(entries, dict) or entries and isinstance(entries[0], dict) and 'views' not in entries[0]:
+            entries = [entries]
+    for i, entry in enumerate(entries):
+        if isinstance(entry, dict):
+            yield entry.get('id', i), entry['views']
+        else:
+            yield i, entry
+
+def convert(views, cleanse=True, timeout=None):
+    '''Runs infer -> cleanse -> solve -> to_swiftui on one sketch given as a
+    list of view dicts and returns the result as a dict.
+    '''
+    start = time.perf_counter()
+    hierarchy = infer_hierarchy([View.from_dict(view) for view in views])
+    if cleanse:
+        hierarchy.cleanse()
+    status = hierarchy.solve(timeout=timeout)
+    return {'swiftui': hierarchy.to_swiftui(),
+            'status': status.name,
+            'seconds': time.perf_counter() - start}
+
+def convert_entry(entry, cleanse=True, timeout=None):
+    sketch_id, views = entry
+    try:
+        result = convert(views, cleanse, timeout)
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    result['id'] = sketch_id
+    return result
+
+def run(sketches, out, workers=None, cleanse=True, timeout=None):
+    '''Converts every sketch and writes a JSON line per result to out. With
+    more than one worker, sketches are spread over a process pool while
+    results are still written in input order. Returns the number converted.
+    '''
+    count = 0
+    def write(result):
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+    if workers is None or workers <= 1:
+        for entry in sketches:
+            write(convert_entry(entry, cleanse, timeout))
+            count += 1
+        return count
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        # Keep a bounded window in flight so huge inputs are never all queued
+        pending = deque()
+        for entry in sketches:
+            pending.append(pool.submit(convert_entry, entry, cleanse, timeout))
+            if len(pending) >= workers * 4:
+                write(pending.popleft().result())
+                count += 1
+        while pending:
+            write(pending.popleft().result())
+            count += 1
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='JSON or JSONL file of sketches, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='JSONL output file, - for stdout')
+    parser.add_argument('--workers', type=int, default=None, help='size of the process pool')
+    parser.add_argument('--no-cleanse', dest='cleanse', action='store_false',
+                        help='solve the sketches exactly as drawn')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per stack')
+    args = parser.parse_args(argv)
+    f = sys.stdin if args.input == '-' else open(args.input)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        run(read_sketches(f), out, args.workers, args.cleanse, args.timeout)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+'''Benchmarks for the layout pipeline. Run from src/ as `python bench.py <name>`.'''
+from view import *
+from constraint_solver import *
+from hierarchy import *
+from sketches import *
+from sizes import parse_size, scale_hierarchy, size_report, solve_sizes
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+def timed(f, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        f(*args)
+    return time.perf_counter() - start
+
+def bench_scaling(sizes):
+    '''Time of one z3 solve of a single stack as the child count grows.'''
+    print('children  seconds')
+    for n in sizes:
+        views = stack_views(n)
+        print(f'{n:8d}  {timed(ConstraintSolver(views, closed_form=False).solve):.3f}')
+
+def bench_session(stacks, sizes):
+    '''Amortized z3 time per stack with a fresh SolverSession per stack and
+    with one session shared by all of them.
+    '''
+    jobs = [stack_views(sizes[i % len(sizes)], seed=i) for i in range(stacks)]
+    fresh = sum(timed(ConstraintSolver(views, closed_form=False).solve) for views in jobs)
+    session = SolverSession()
+    shared = sum(timed(ConstraintSolver(views, closed_form=False, session=session).solve) for views in jobs)
+    print(f'fresh   {fresh / stacks * 1000:.1f} ms/stack')
+    print(f'shared  {shared / stacks * 1000:.1f} ms/stack')
+
+def bench_infer(children, depth, seeds):
+    '''Time of infer_hierarchy on large random sketches.'''
+    print('views  seconds')
+    for seed in range(seeds):
+        views = random_sketch(children=children, depth=depth, nesting=0.8, size=(6000, 4000), seed=seed)
+        count = len(views) - 1
+        print(f'{count:5d}  {timed(infer_hierarchy, views):.4f}')
+    # One long row is the worst case for rescanning the remaining views
+    for count in [100, 300, 1000]:
+        print(f'{count:5d}  {timed(infer_hierarchy, stack_views(count)):.4f}  single row')
+
+class WarmStartSolver(ConstraintSolver):
+    '''Seeds z3 with an estimate read off the drawn geometry before it
+    searches. Only for bench_warm: it was measured and not adopted.
+    '''
+    def estimate(self):
+        '''Like the fallback layout, but the smallest gap between children is
+        the spacing, unframed children get no frame and the stack is centered
+        when every child is. It need not be feasible.
+        '''
+        solution = self.solve_fallback()
+        children = self.views[1:]
+        major_axis = int(self.views[0].view_type)
+        minor_axis = (major_axis + 1) % 2
+        gaps = [b.top_left[major_axis] - a.bot_right[major_axis] for a, b in zip(children, children[1:])]
+        spacing = max(min(gaps), 0) if gaps else 0
+        for i, view in enumerate(children):
+            padding = solution.paddings[i]
+            if i > 0:
+                padding[2 * major_axis] = max(padding[2 * major_axis] - spacing, 0)
+            if view.view_mode == ViewMode.Unframed:
+                solution.frames[i] = [0, 0]
+        centered = all(padding[2 * minor_axis] == padding[2 * minor_axis + 1] for padding in solution.paddings)
+        return StackSolution(1 if centered else 0, spacing, solution.frames, solution.paddings)
+
+    def extend(self, s, Spacing, Alignment, Frames, PrePad, PostPad):
+        estimate = self.estimate()
+        s.set_initial_value(Spacing, estimate.spacing)
+        s.set_initial_value(Alignment, estimate.alignment)
+        for i, (frame, padding) in enumerate(zip(estimate.frames, estimate.paddings)):
+            for axis in range(2):
+                s.set_initial_value(Frames[axis][i], frame[axis])
+                s.set_initial_value(PrePad[axis][i], padding[2 * axis])
+                s.set_initial_value(PostPad[axis][i], padding[2 * axis + 1])
+
+def bench_warm(sizes, seeds):
+    '''z3 time per stack without and with a warm start from the drawn
+    geometry, see WarmStartSolver, on single stacks of growing size and on
+    every stack of cleansed random sketches.
+    '''
+    def cold_and_warm(jobs):
+        times = []
+        for solver in [ConstraintSolver, WarmStartSolver]:
+            times.append(statistics.median(
+                timed(solver([View.deepcopy(view) for view in views], closed_form=False).solve) for views in jobs))
+        return times
+    print('layout           cold    warm')
+    for n in sizes:
+        cold, warm = cold_and_warm([stack_views(n, seed=seed) for seed in range(seeds)])
+        print(f'stack {n:3d}     {cold:7.3f} {warm:7.3f}')
+    jobs = []
+    for seed in range(seeds):
+        hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, seed=seed))
+        hierarchy.cleanse()
+        jobs.extend([stack] + stack.children for stack in hierarchy.stacks())
+    cold, warm = cold_and_warm(jobs)
+    print(f'sketch stacks {cold:7.3f} {warm:7.3f}')
+
+def bench_decompose(sizes, seeds):
+    '''z3 time per stack solved whole and with decompose, on single stacks
+    of growing size and on every stack of cleansed random sketches. Also
+    counts the stacks that had to be solved whole after all.
+    '''
+    def whole_and_decomposed(jobs):
+        times = []
+        for decompose in [False, True]:
+            seconds = []
+            undecomposed = 0
+            for views in jobs:
+                solver = ConstraintSolver([View.deepcopy(view) for view in views], closed_form=False,
+                                          decompose=decompose)
+                solution = solver.solve()
+                seconds.append(solution.stats['seconds'])
+                undecomposed += solution.stats['method'] == 'z3'
+            times.append(statistics.median(seconds))
+        return times + [undecomposed]
+    print('layout           whole  decomp  undecomposed')
+    for n in sizes:
+        whole, decomposed, undecomposed = whole_and_decomposed([stack_views(n, seed=seed) for seed in range(seeds)])
+        print(f'stack {n:3d}     {whole:7.3f} {decomposed:7.3f}  {undecomposed}')
+    jobs = []
+    for seed in range(seeds):
+        hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, seed=seed))
+        hierarchy.cleanse()
+        jobs.extend([stack] + stack.children for stack in hierarchy.stacks())
+    whole, decomposed, undecomposed = whole_and_decomposed(jobs)
+    print(f'sketch stacks {whole:7.3f} {decomposed:7.3f}  {undecomposed} of {len(jobs)}')
+
+def bench_sizes(sizes, seeds):
+    '''Time to lay a cleansed random sketch out at every size with
+    solve_sizes, which shares frames and spacing across sizes, and with an
+    independent solve of the stretched drawing per size. separate counts the
+    stacks solved for one size on their own, varying the constraints
+    size_report lists.
+    '''
+    print('seed  sizes  stacks  joint  independent  separate  varying')
+    for seed in range(seeds):
+        hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, seed=seed))
+        hierarchy.cleanse()
+        scaled = [scale_hierarchy(hierarchy, size) for size in sizes]
+        independent = sum(timed(copy.solve) for copy in scaled)
+        start = time.perf_counter()
+        layouts = solve_sizes(hierarchy, sizes)
+        joint = time.perf_counter() - start
+        separate = sum(layout.separate for layout in layouts)
+        varying = len(size_report(layouts))
+        print(f'{seed:4d}  {len(sizes):5d}  {len(hierarchy.stacks()):6d}  {joint:5.3f}  {independent:11.3f}'
+              f'  {separate:8d}  {varying:7d}')
+
+def bench_backends(sizes, seeds):
+    '''Median time per stack of every solver backend, on single stacks of
+    growing size and on every stack of cleansed random sketches, with the
+    number of stacks each one had to fall back on.
+    '''
+    from milp import MILPBackend
+    backends = [Z3Backend(), MILPBackend()]
+    def per_backend(jobs):
+        row = []
+        for backend in backends:
+            solutions = [ConstraintSolver([View.deepcopy(view) for view in views], closed_form=False,
+                                          backend=backend).solve() for views in jobs]
+            row.append((statistics.median(solution.stats['seconds'] for solution in solutions),
+                        sum(solution.status == SolveStatus.Fallback for solution in solutions)))
+        return '  '.join(f'{seconds:7.3f} {fallbacks:3d}' for seconds, fallbacks in row)
+    print('layout         ' + '  '.join(f'{backend.name:>7s} {"fb":>3s}' for backend in backends))
+    for n in sizes:
+        print(f'stack {n:3d}      {per_backend([stack_views(n, seed=seed) for seed in range(seeds)])}')
+    jobs = []
+    for seed in range(seeds):
+        hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, seed=seed))
+        hierarchy.cleanse()
+        jobs.extend([stack] + stack.children for stack in hierarchy.stacks())
+    print(f'sketch stacks  {per_backend(jobs)}')
+
+STARTUP = '''import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'z3' in sys.modules)'''
+
+def bench_startup(modules, runs):
+    '''Seconds to import each module in a fresh interpreter, and whether that
+    loaded z3. Modules whose dependencies are missing are skipped.
+    '''
+    print('module              seconds  z3')
+    for module in modules:
+        samples = []
+        for run in range(runs):
+            done = subprocess.run([sys.executable, '-c', STARTUP.format(module=module)],
+                                  capture_output=True, text=True)
+            if done.returncode != 0:
+                break
+            seconds, z3_loaded = done.stdout.split()
+            samples.append(float(seconds))
+        if len(samples) < runs:
+            print(f'{module:18s}  unavailable: {done.stderr.strip().splitlines()[-1]}')
+        else:
+            print(f'{module:18s}  {statistics.median(samples):7.3f}  {z3_loaded}')
+
+STAGES = ['infer', 'cleanse', 'solve', 'to_swiftui']
+
+def pipeline_times(views, timeout=None):
+    '''Runs infer -> cleanse -> solve -> to_swiftui and times each stage.'''
+    times = {}
+    start = time.perf_counter()
+    hierarchy = infer_hierarchy(views)
+    times['infer'] = time.perf_counter() - start
+    times['cleanse'] = timed(hierarchy.cleanse)
+    times['solve'] = timed(lambda: hierarchy.solve(timeout=timeout))
+    times['to_swiftui'] = timed(hierarchy.to_swiftui)
+    return times
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(children, depths, framed_ratio, jitter, seeds, timeout, output):
+    '''Times every pipeline stage on random sketches over a grid of child
+    counts and nesting depths, and writes the medians to a JSON file.
+    '''
+    runs = []
+    print('children  depth  views  ' + '  '.join(f'{stage:>10}' for stage in STAGES))
+    for count in children:
+        for depth in depths:
+            samples = []
+            views = 0
+            for seed in range(seeds):
+                sketch = random_sketch(children=count, depth=depth, framed_ratio=framed_ratio,
+                                       jitter=jitter, seed=seed)
+                views += len(sketch) - 1
+                samples.append(pipeline_times(sketch, timeout))
+            run = {'children': count, 'depth': depth, 'framed_ratio': framed_ratio, 'jitter': jitter,
+                   'seeds': seeds, 'views': views / seeds,
+                   'seconds': {stage: statistics.median(sample[stage] for sample in samples)
+                               for stage in STAGES}}
+            runs.append(run)
+            print(f'{count:8d}  {depth:5d}  {run["views"]:5.1f}  ' +
+                  '  '.join(f'{run["seconds"][stage]:10.4f}' for stage in STAGES))
+    with open(output, 'w') as f:
+        json.dump({'commit': git_commit(), 'timeout': timeout, 'runs': runs}, f, indent=2)
+
+def bench_compare(before, after):
+    '''Prints after/before time ratios for the runs two suite files share.'''
+    def load(path):
+        with open(path) as f:
+            results = json.load(f)
+        runs = {(run['children'], run['depth'], run['framed_ratio'], run['jitter']): run
+                for run in results['runs']}
+        return results['commit'], runs
+    before_commit, before_runs = load(before)
+    after_commit, after_runs = load(after)
+    print(f'{after_commit} vs {before_commit}, ratio of median times (< 1 is faster)')
+    print('children  depth  ' + '  '.join(f'{stage:>10}' for stage in STAGES))
+    for key in before_runs:
+        if key not in after_runs:
+            continue
+        ratios = []
+        for stage in STAGES:
+            old, new = before_runs[key]['seconds'][stage], after_runs[key]['seconds'][stage]
+            ratios.append(f'{new / old:10.2f}' if old > 0 else f'{"-":>10}')
+        print(f'{key[0]:8d}  {key[1]:5d}  ' + '  '.join(ratios))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='bench', required=True)
+    scaling = sub.add_parser('scaling', help=bench_scaling.__doc__)
+    scaling.add_argument('--sizes', type=int, nargs='+', default=[2, 5, 10, 15, 20, 30, 40, 50])
+    session = sub.add_parser('session', help=bench_session.__doc__)
+    session.add_argument('--stacks', type=int, default=50)
+    session.add_argument('--sizes', type=int, nargs='+', default=[3, 4, 5, 6, 8])
+    infer = sub.add_parser('infer', help=bench_infer.__doc__)
+    infer.add_argument('--children', type=int, default=8)
+    infer.add_argument('--depth', type=int, default=4)
+    infer.add_argument('--seeds', type=int, default=5)
+    startup = sub.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('--modules', nargs='+',
+                         default=['view', 'hierarchy', 'incremental', 'batch', 'server', 'main', 'z3'])
+    startup.add_argument('--runs', type=int, default=5)
+    warm = sub.add_parser('warm', help=bench_warm.__doc__)
+    # At 40 children one seed takes minutes warm
+    warm.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20])
+    warm.add_argument('--seeds', type=int, default=5)
+    decompose = sub.add_parser('decompose', help=bench_decompose.__doc__)
+    decompose.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20, 40])
+    decompose.add_argument('--seeds', type=int, default=5)
+    sizes = sub.add_parser('sizes', help=bench_sizes.__doc__)
+    sizes.add_argument('--sizes', nargs='+', default=['320x568', '375x667', '390x844', '428x926', '768x1024'],
+                       help='width x height')
+    sizes.add_argument('--seeds', type=int, default=5)
+    backends = sub.add_parser('backends', help=bench_backends.__doc__)
+    backends.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20, 40])
+    backends.add_argument('--seeds', type=int, default=5)
+    suite = sub.add_parser('suite', help=bench_suite.__doc__)
+    suite.add_argument('--children', type=int, nargs='+', default=[2, 4, 6])
+    suite.add_argument('--depths', type=int, nargs='+', default=[1, 2, 3])
+    suite.add_argument('--framed-ratio', type=float, default=0.7)
+    suite.add_argument('--jitter', type=float, default=2.0)
+    suite.add_argument('--seeds', type=int, default=5)
+    suite.add_argument('--timeout', type=float, default=None, help='seconds per stack')
+    suite.add_argument('--output', default='bench_results.json')
+    compare = sub.add_parser('compare', help=bench_compare.__doc__)
+    compare.add_argument('before')
+    compare.add_argument('after')
+    args = parser.parse_args()
+    if args.bench == 'scaling':
+        bench_scaling(args.sizes)
+    elif args.bench == 'session':
+        bench_session(args.stacks, args.sizes)
+    elif args.bench == 'infer':
+        bench_infer(args.children, args.depth, args.seeds)
+    elif args.bench == 'startup':
+        bench_startup(args.modules, args.runs)
+    elif args.bench == 'warm':
+        bench_warm(args.sizes, args.seeds)
+    elif args.bench == 'sizes':
+        bench_sizes([parse_size(size) for size in args.sizes], args.seeds)
+    elif args.bench == 'backends':
+        bench_backends(args.sizes, args.seeds)
+    elif args.bench == 'decompose':
+        bench_decompose(args.sizes, args.seeds)
+    elif args.bench == 'suite':
+        bench_suite(args.children, args.depths, args.framed_ratio, args.jitter, args.seeds,
+                    args.timeout, args.output)
+    elif args.bench == 'compare':
+        bench_compare(args.before, args.after)
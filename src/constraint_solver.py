@@ -1,101 +1,349 @@
-from z3 import *
 from view import *
+from fractions import Fraction
+from enum import IntEnum
+import logging
+import time
+
+# Debug output is opt-in, e.g. logging.getLogger('constraint_solver').setLevel(logging.DEBUG)
+log = logging.getLogger(__name__)
+
+class SolveStatus(IntEnum):
+    '''How good a StackSolution is. Larger is worse, so the status of a whole
+    hierarchy is the max over its stacks.
+    '''
+    Optimal = 0
+    # The time limit ran out, this is the best model z3 found until then
+    Feasible = 1
+    # No model, the constraints were read off the geometry instead
+    Fallback = 2
+
+class StackSolution:
+    '''Solved constraints for one stack, detached from the views they were
+    solved on so they can be shipped between processes and applied later.
+    frames and paddings hold one entry per child, in child order.
+    '''
+    def __init__(self, alignment, spacing, frames, paddings, status=SolveStatus.Optimal):
+        self.alignment = alignment
+        self.spacing = spacing
+        self.frames = frames
+        self.paddings = paddings
+        self.status = status
+        # Filled in by ConstraintSolver.solve, see SolveProfiler
+        self.stats = None
+
+    def to_dict(self):
+        return {'alignment': self.alignment, 'spacing': self.spacing,
+                'frames': self.frames, 'paddings': self.paddings,
+                'status': int(self.status)}
+
+    @staticmethod
+    def from_dict(d):
+        return StackSolution(d['alignment'], d['spacing'], d['frames'], d['paddings'],
+                             SolveStatus(d.get('status', SolveStatus.Optimal)))
+
+    def apply(self, views):
+        root = views[0]
+        root.alignment = self.alignment
+        root.gen_spacing(self.spacing)
+        for view, frame, padding in zip(views[1:], self.frames, self.paddings):
+            view.gen_frame(*frame)
+            view.gen_padding(*padding)
+
+def stack_timeout(timeout, deadline):
+    '''Seconds one stack may take given a per-stack timeout and a time.time()
+    deadline for the whole hierarchy, either of which may be None.
+    '''
+    if deadline is None:
+        return timeout
+    remaining = max(deadline - time.time(), 0)
+    return remaining if timeout is None else min(timeout, remaining)
+
+def exact(value):
+    '''A coordinate as z3 reads it: a float is taken by its shortest
+    decimal, so 0.1 is exactly 1/10.
+    '''
+    return Fraction(str(value))
+
+def exact_size(view, axis):
+    '''view.size(axis) in exact arithmetic over the coordinates as z3 reads
+    them. The float subtraction can round, 0.3 - 0.1 is 0.19999999999999998,
+    and z3 would take that literally and find the stack UNSAT.
+    '''
+    return exact(view.bot_right[axis]) - exact(view.top_left[axis])
+
+def frame_options(view, axis):
+    '''The frames view can take on axis: its exact size when it is framed,
+    else also 0.
+    '''
+    size = exact_size(view, axis)
+    return [size] if view.view_mode == ViewMode.Framed or size == 0 else [Fraction(0), size]
+
+def matching_pairs(size_classes, ctx):
+    '''The number of pairs of children with the same frame, as a z3 term.
+    size_classes maps every (height, width) a child can take to the
+    conditions under which its children take it, at most one per child. A
+    class of k children holds k(k-1)/2 pairs, the sum of t - 1 over t up to
+    k, so the term grows with the number of conditions, not with its square.
+    '''
+    from z3 import If, IntVal, Sum
+    pairs = [IntVal(0, ctx)]
+    for members in size_classes.values():
+        if len(members) > 1:
+            count = Sum([If(member, 1, 0) for member in members])
+            pairs.extend(If(count >= t, t - 1, 0) for t in range(2, len(members) + 1))
+    return Sum(pairs)
+
+def preload():
+    '''Imports z3, which this module otherwise only does on the first solve.
+    Call it off the main thread to have z3 ready without delaying startup.
+    '''
+    import z3
+
+def solve_stack(views, timeout=None, deadline=None, backend=None):
+    '''Solves one stack and returns its StackSolution. Module level so that it
+    can be sent to a process pool.
+    '''
+    return ConstraintSolver(views, timeout=stack_timeout(timeout, deadline), backend=backend).solve()
+
+class Z3Backend:
+    '''Solves stacks with z3's Optimize, see ConstraintSolver.optimize.
+
+    A backend is anything with a name, which ends up in the solve stats as
+    the method, and a solve(solver) method that returns a StackSolution for
+    solver.views or None when there is no answer, within solver.time_left().
+    Backends are sent to process pools, so they must pickle. See milp.py for
+    the other one.
+    '''
+    name = 'z3'
+
+    def solve(self, solver):
+        return solver.solve_z3()
+
+class SolverSession:
+    '''One z3 context and Optimize shared by many stack solves, within a
+    hierarchy and across submits. Child slots are numbered like the views of a
+    stack, so stacks of similar shape reuse the same symbols, their base
+    constraints and whatever z3 has learned about them. Each stack is solved in
+    its own push/pop scope, and which children are framed is passed as
+    assumption literals instead of being asserted.
+
+    Reuse makes a stack's answer depend on what the session solved before,
+    so ties may break differently than with a fresh session.
+    '''
+    def __init__(self):
+        from z3 import Context, Int, Optimize, Real
+        self.ctx = Context()
+        self.optimize = Optimize(ctx=self.ctx)
+        self.solves = 0
+        self.Spacing = Real('Spacing', self.ctx)
+        # 0 = leading, 1 = center, 2 = trailing
+        self.Alignment = Int('Alignment', self.ctx)
+        self.Frames = [[], []]
+        self.PrePad = [[], []]
+        self.PostPad = [[], []]
+        self.Framed = []
+        self.optimize.add(self.Spacing >= 0)
+        self.optimize.add(self.Alignment >= 0)
+        self.optimize.add(self.Alignment <= 2)
+
+    def variables(self, n):
+        '''Returns the symbols for a stack with n children. Missing child slots
+        are created with their base constraints, so call this outside any scope.
+        '''
+        from z3 import And, Bool, Implies, Real
+        for i in range(len(self.Framed), n):
+            for axis, (frame, pre, post) in enumerate([('FrameHeight', 'PadTop', 'PadBot'),
+                                                       ('FrameWidth', 'PadLeft', 'PadRight')]):
+                self.Frames[axis].append(Real(frame + str(i), self.ctx))
+                self.PrePad[axis].append(Real(pre + str(i), self.ctx))
+                self.PostPad[axis].append(Real(post + str(i), self.ctx))
+                for var in [self.Frames[axis][i], self.PrePad[axis][i], self.PostPad[axis][i]]:
+                    self.optimize.add(var >= 0)
+            self.Framed.append(Bool('Framed' + str(i), self.ctx))
+            self.optimize.add(Implies(self.Framed[i], And(self.Frames[0][i] != 0, self.Frames[1][i] != 0)))
+        def first(l):
+            return [l[0][:n], l[1][:n]]
+        return (self.Spacing, self.Alignment, first(self.Frames), first(self.PrePad),
+                first(self.PostPad), self.Framed[:n])
 
 # Constraint Solver for one level (no hierarchy)
 class ConstraintSolver:
-    def __init__(self, views):
+    def __init__(self, views, closed_form=True, cache=None, session=None, timeout=None, decompose=False,
+                 backend=None):
         self.views = views
+        # What solves the stacks the closed form does not, a Z3Backend by default
+        self.backend = backend if backend is not None else Z3Backend()
+        self.closed_form = closed_form
+        # Try solve_decomposed before the whole stack, see `bench.py decompose`
+        self.decompose = decompose
+        self.cache = cache
+        self.session = session
+        # Seconds z3 may spend on this stack, None for no limit
+        self.timeout = timeout
+        # time.perf_counter() by which solve() has to be done, set when it starts
+        self.deadline = None
 
     def solve(self):
-        print('\n'.join([str(view) for view in self.views]))
-        Spacing = Real('Spacing')
-        # 0 = leading, 1 = center, 2 = trailing
-        Alignment = Int('Alignment')
-        Frames = [[Real('FrameHeight' + str(i)) for i in range(len(self.views) - 1)],
-                  [Real('FrameWidth' + str(i)) for i in range(len(self.views) - 1)]]
-        PrePad = [[Real('PadTop' + str(i)) for i in range(len(self.views) - 1)],
-                  [Real('PadLeft' + str(i)) for i in range(len(self.views) - 1)]]
-        PostPad = [[Real('PadBot' + str(i)) for i in range(len(self.views) - 1)],
-                  [Real('PadRight' + str(i)) for i in range(len(self.views) - 1)]]
-
-        s = Optimize()
-        s.add(Spacing >= 0)
-        s.add(Alignment >= 0)
-        s.add(Alignment <= 2)
-        def nonzero_list(l):
-            for prop in l[0] + l[1]:
-                s.add(prop >= 0)
-        nonzero_list(Frames)
-        nonzero_list(PrePad)
-        nonzero_list(PostPad)
+        log.debug('\n'.join([str(view) for view in self.views]))
+        start = time.perf_counter()
+        if self.timeout is not None:
+            self.deadline = start + self.timeout
+        self.objectives = 0
+        self.z3_stats = None
+        method = 'cache'
+        solution = self.cache.get(self.views) if self.cache is not None else None
+        if solution is None:
+            if self.closed_form:
+                method = 'closed_form'
+                solution = self.solve_closed_form()
+            if solution is None and self.decompose and self.time_left() != 0:
+                method = 'decomposed'
+                solution = self.solve_decomposed()
+            if solution is None and self.time_left() != 0:
+                method = self.backend.name
+                solution = self.backend.solve(self)
+            if solution is None:
+                method = 'fallback'
+                solution = self.solve_fallback()
+            # Timed out answers could be improved by the next solve
+            if self.cache is not None and solution.status == SolveStatus.Optimal:
+                self.cache.put(self.views, solution)
+        solution.apply(self.views)
+        solution.stats = {'view_type': ViewType(self.views[0].view_type).name,
+                          'children': len(self.views) - 1,
+                          'method': method,
+                          'status': solution.status.name,
+                          'seconds': time.perf_counter() - start,
+                          'objectives': self.objectives,
+                          'z3': self.z3_stats}
+        return solution
+
+    def time_left(self):
+        '''Seconds left of the timeout, shared by every way solve() tries,
+        None for no limit. The whole timeout before solve() starts.
+        '''
+        if self.timeout is None:
+            return None
+        if self.deadline is None:
+            return self.timeout
+        return max(self.deadline - time.perf_counter(), 0)
+
+    def z3_timeout(self):
+        '''time_left() in the milliseconds z3 takes.'''
+        left = self.time_left()
+        return 4294967295 if left is None else max(1, int(left * 1000))
+
+    def solve_z3(self):
+        # A fresh session per stack keeps results independent of whatever was
+        # solved before, so the same stack always gets the same answer.
+        session = self.session if self.session is not None else SolverSession()
+        variables = session.variables(len(self.views) - 1)
+        # The setting sticks to a shared session
+        session.optimize.set(timeout=self.z3_timeout())
+        session.optimize.push()
+        try:
+            return self.optimize(session.optimize, *variables)
+        finally:
+            session.optimize.pop()
+            session.solves += 1
+
+    def stack_top_left(self, Spacing, Frames, PrePad, PostPad):
+        '''Where the first child starts when no child fills the stack.'''
+        from z3 import Sum
+        root = self.views[0]
+        major_axis = int(root.view_type)
+        return root.top_left[major_axis] + (root.size(major_axis) - (Sum(Frames[major_axis]) \
+               + Sum(PrePad[major_axis]) \
+               + Sum(PostPad[major_axis]) \
+               + Spacing * (len(self.views) - 2))) / 2
+
+    def add_major(self, s, i, Spacing, Frames, PrePad, PostPad, stack_top_left):
+        '''Places child i where the layout puts it along the major axis. Only
+        uses the major axis entries of Frames, PrePad and PostPad.
+        '''
+        from z3 import If, Sum
+        root = self.views[0]
+        view = self.views[i + 1]
+        major_axis = int(root.view_type)
+        fsize = (root.size(major_axis) \
+                 - Spacing * (len(self.views) - 2) \
+                 - Sum(PrePad[major_axis]) \
+                 - Sum(PostPad[major_axis]) \
+                 - Sum(Frames[major_axis])) \
+                 / Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis]])
+        top_major = Sum(Frames[major_axis][:i]) \
+                  + Sum(PrePad[major_axis][:i+1]) \
+                  + Sum(PostPad[major_axis][:i]) \
+                  + Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis][:i]]) * fsize \
+                  + Spacing * i \
+                  + If(Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis]]) == 0, stack_top_left, root.top_left[major_axis])
+        bot_major = top_major + If(Frames[major_axis][i] == 0, fsize,
+                                   Frames[major_axis][i])
+        s.add(view.top_left[major_axis] == top_major)
+        s.add(view.bot_right[major_axis] == bot_major)
+
+    def add_minor(self, s, i, Alignment, Frames, PrePad, PostPad):
+        '''Places child i where the layout puts it along the minor axis. Only
+        uses the minor axis entries of Frames, PrePad and PostPad.
+        '''
+        from z3 import If
+        root = self.views[0]
+        view = self.views[i + 1]
+        minor_axis = int(ViewType.HStack if root.view_type == ViewType.VStack else ViewType.VStack)
+        top_minor_nf = root.top_left[minor_axis] + PrePad[minor_axis][i]
+        bot_minor_nf = root.bot_right[minor_axis] - PostPad[minor_axis][i]
+
+        top_minor_alead = root.top_left[minor_axis] + PrePad[minor_axis][i]
+        bot_minor_alead = top_minor_alead + Frames[minor_axis][i]
 
+        top_minor_acenter = (root.bot_right[minor_axis] - root.top_left[minor_axis] \
+                            - PrePad[minor_axis][i] - PostPad[minor_axis][i] - Frames[minor_axis][i]) / 2 \
+                            + top_minor_alead
+        bot_minor_acenter = top_minor_acenter + Frames[minor_axis][i]
+
+        bot_minor_atrail = root.bot_right[minor_axis] - PostPad[minor_axis][i]
+        top_minor_atrail = bot_minor_atrail - Frames[minor_axis][i]
+
+        s.add(view.top_left[minor_axis] == If(Frames[minor_axis][i] == 0,
+                                              top_minor_nf,
+                                           If(Alignment == 0,
+                                              top_minor_alead,
+                                           If(Alignment == 1,
+                                              top_minor_acenter,
+                                              top_minor_atrail))))
+        s.add(view.bot_right[minor_axis] == If(Frames[minor_axis][i] == 0,
+                                               bot_minor_nf,
+                                            If(Alignment == 0,
+                                               bot_minor_alead,
+                                            If(Alignment == 1,
+                                               bot_minor_acenter,
+                                               bot_minor_atrail))))
+
+    def extend(self, s, Spacing, Alignment, Frames, PrePad, PostPad):
+        '''Called by optimize after its own constraints and objectives and
+        before it solves, to add more of both. Adds nothing here, see
+        sizes.JointSolver.
+        '''
+        pass
+
+    def optimize(self, s, Spacing, Alignment, Frames, PrePad, PostPad, Framed):
+        from z3 import And, If, Q, Sum, Z3Exception, is_true, sat, unknown
         root = self.views[0]
         major_axis = int(root.view_type)
         minor_axis = int(ViewType.HStack if root.view_type == ViewType.VStack else ViewType.VStack)
 
-        stack_top_left = root.top_left[major_axis] + (root.size(major_axis) - (Sum(Frames[major_axis]) \
-                         + Sum(PrePad[major_axis]) \
-                         + Sum(PostPad[major_axis]) \
-                         + Spacing * (len(self.views) - 2))) / 2
+        stack_top_left = self.stack_top_left(Spacing, Frames, PrePad, PostPad)
         s.add(stack_top_left - root.top_left[major_axis] >= -3)
 
         unframed_vmode = 0
+        assumptions = []
 
         for i, view in enumerate(self.views[1:]):
-            fsize = (root.size(major_axis) \
-                     - Spacing * (len(self.views) - 2) \
-                     - Sum(PrePad[major_axis]) \
-                     - Sum(PostPad[major_axis]) \
-                     - Sum(Frames[major_axis])) \
-                     / Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis]])
-            top_major = Sum(Frames[major_axis][:i]) \
-                      + Sum(PrePad[major_axis][:i+1]) \
-                      + Sum(PostPad[major_axis][:i]) \
-                      + Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis][:i]]) * fsize \
-                      + Spacing * i \
-                      + If(Sum([If(sz == 0, 1, 0) for sz in Frames[major_axis]]) == 0, stack_top_left, root.top_left[major_axis])
-            bot_major = top_major + If(Frames[major_axis][i] == 0, fsize,
-                                       Frames[major_axis][i])
-
-            top_minor_nf = root.top_left[minor_axis] + PrePad[minor_axis][i]
-            bot_minor_nf = root.bot_right[minor_axis] - PostPad[minor_axis][i]
-
-            top_minor_alead = root.top_left[minor_axis] + PrePad[minor_axis][i]
-            bot_minor_alead = top_minor_alead + Frames[minor_axis][i]
-
-            top_minor_acenter = (root.bot_right[minor_axis] - root.top_left[minor_axis] \
-                                - PrePad[minor_axis][i] - PostPad[minor_axis][i] - Frames[minor_axis][i]) / 2 \
-                                + top_minor_alead
-            bot_minor_acenter = top_minor_acenter + Frames[minor_axis][i]
-
-            bot_minor_atrail = root.bot_right[minor_axis] - PostPad[minor_axis][i]
-            top_minor_atrail = bot_minor_atrail - Frames[minor_axis][i]
-
-            tolerance = 1
-            def add_with_tolerance(a, b):
-                s.add(a==b)
-                # s.add(a-b < tolerance)
-                # s.add(a-b > -tolerance)
-            add_with_tolerance(view.top_left[major_axis], top_major)
-            add_with_tolerance(view.bot_right[major_axis], bot_major)
-            add_with_tolerance(view.top_left[minor_axis], If(Frames[minor_axis][i] == 0,
-                                                  top_minor_nf,
-                                               If(Alignment == 0,
-                                                  top_minor_alead,
-                                               If(Alignment == 1,
-                                                  top_minor_acenter,
-                                                  top_minor_atrail))))
-            add_with_tolerance(view.bot_right[minor_axis], If(Frames[minor_axis][i] == 0,
-                                                  bot_minor_nf,
-                                               If(Alignment == 0,
-                                                  bot_minor_alead,
-                                               If(Alignment == 1,
-                                                  bot_minor_acenter,
-                                                  bot_minor_atrail))))
+            self.add_major(s, i, Spacing, Frames, PrePad, PostPad, stack_top_left)
+            self.add_minor(s, i, Alignment, Frames, PrePad, PostPad)
             # assert that frame matches
             if view.view_mode == ViewMode.Framed:
-                s.add(Frames[major_axis][i] != 0)
-                s.add(Frames[minor_axis][i] != 0)
+                assumptions.append(Framed[i])
             else:
                 unframed_vmode += If(Frames[major_axis][i] == 0, 1, 0)
                 unframed_vmode += If(Frames[minor_axis][i] == 0, 1, 0)
@@ -107,13 +355,22 @@ class ConstraintSolver:
 
         # constrained_frames = Sum([If(sz == 0, 0, 1) for sz in Frames[major_axis] + Frames[minor_axis]])
         # s.minimize(constrained_frames)
-        # maximize matching frames
-        matching_frames = 0
-        for i in range(len(Frames[0])):
-            for j in range(i+1, len(Frames[0])):
-                matching_frames += If(Frames[0][i] == Frames[0][j] and
-                                      Frames[1][i] == Frames[1][j], 1, 0)
-        s.maximize(matching_frames)
+        # maximize matching frames. The positions above force a frame to be
+        # either 0 or the view's size on that axis, so every (height, width)
+        # pair a child can take is known up front. Children are grouped into
+        # these size classes and the pairs are counted per class, which
+        # stays linear in the number of children instead of comparing every
+        # pair. Sizes are exact, or they would not match the positions.
+        def frame_is(var, size):
+            return var == Q(size.numerator, size.denominator, Spacing.ctx)
+        size_classes = {}
+        for i, view in enumerate(self.views[1:]):
+            for height in frame_options(view, 0):
+                for width in frame_options(view, 1):
+                    size_classes.setdefault((height, width), []).append(
+                        And(frame_is(Frames[0][i], height), frame_is(Frames[1][i], width)))
+        if len(Frames[0]) > 1:
+            s.maximize(matching_pairs(size_classes, Spacing.ctx))
 
         symmetric_padding = Sum([If(pre == post, 1, 0) for pre, post in
                                  zip(PrePad[minor_axis] + PrePad[major_axis],
@@ -125,30 +382,271 @@ class ConstraintSolver:
 
         if len(Frames[0]) > 1:
             s.maximize(Spacing)
+        self.extend(s, Spacing, Alignment, Frames, PrePad, PostPad)
 
-        if s.check() == sat:
+        result = s.check(*assumptions)
+        statistics = s.statistics()
+        self.z3_stats = {key: statistics.get_key_value(key) for key in statistics.keys()}
+        self.objectives = len(s.objectives())
+        status = SolveStatus.Optimal
+        if result == unknown:
+            # Out of time. Optimize keeps the best model found so far, use it
+            # if it satisfies every hard constraint.
+            try:
+                m = s.model()
+            except Z3Exception:
+                return None
+            hard = list(s.assertions()) + assumptions
+            if not all(is_true(m.eval(a, model_completion=True)) for a in hard):
+                return None
+            status = SolveStatus.Feasible
+            result = sat
+        if result == sat:
             m = s.model()
-            print(m)
+            log.debug('%s', m)
             def get_long(realval):
                 return m[realval].numerator_as_long() / m[realval].denominator_as_long()
-            root.alignment = m[Alignment].as_long()
-            root.gen_spacing(get_long(Spacing))
-            for i, view in enumerate(self.views[1:]):
-                view.gen_frame(get_long(Frames[0][i]), get_long(Frames[1][i]))
-                view.gen_padding(get_long(PrePad[0][i]),
-                                 get_long(PostPad[0][i]),
-                                 get_long(PrePad[1][i]),
-                                 get_long(PostPad[1][i]))
-                print(get_long(PrePad[0][i]),
+            frames = []
+            paddings = []
+            for i in range(len(self.views) - 1):
+                frames.append([get_long(Frames[0][i]), get_long(Frames[1][i])])
+                paddings.append([get_long(PrePad[0][i]),
                                  get_long(PostPad[0][i]),
                                  get_long(PrePad[1][i]),
-                                 get_long(PostPad[1][i]))
+                                 get_long(PostPad[1][i])])
+            return StackSolution(m[Alignment].as_long(), get_long(Spacing), frames, paddings, status)
         else:
-            print("UNSAT")
+            log.info('UNSAT, falling back to the drawn geometry')
+
+    def solve_decomposed(self):
+        '''Solves the major and the minor axis as separate z3 problems. The
+        axes only share the alignment and the size classes. Along the minor
+        axis the alignment is fixed to each of its three values in turn and
+        the best of the three is kept; the major axis is one problem with the
+        minor frames as constants. Every other objective of optimize adds up
+        over the axes, so the result is as good as solving the stack whole.
+
+        That holds as long as the minor frames are the same in every optimum,
+        which they are once each unframed child goes without a minor frame.
+        Returns None when one does not, when no alignment is feasible or when
+        a part runs out of time, and the stack is then solved whole. The parts
+        and that solve share the timeout. The session is not used.
+
+        Only ConstraintSolver(decompose=True) solves this way. It is no faster
+        than solving whole, see `bench.py decompose`, so Hierarchy.solve and
+        what builds on it do not offer it.
+        '''
+        from z3 import Context, If, Int, Optimize, Or, Q, Real, Sum, sat, unknown
+        root = self.views[0]
+        children = self.views[1:]
+        if len(children) == 0:
+            return None
+        major_axis = int(root.view_type)
+        minor_axis = (major_axis + 1) % 2
+        unframed = [i for i, view in enumerate(children) if view.view_mode == ViewMode.Unframed]
+        ctx = Context()
+        stats = {}
+        self.objectives = 0
+
+        def variables(axis):
+            # Slots of the other axis are never touched by add_major and add_minor
+            Frames, PrePad, PostPad = [None, None], [None, None], [None, None]
+            frame, pre, post = [('FrameHeight', 'PadTop', 'PadBot'), ('FrameWidth', 'PadLeft', 'PadRight')][axis]
+            Frames[axis] = [Real(frame + str(i), ctx) for i in range(len(children))]
+            PrePad[axis] = [Real(pre + str(i), ctx) for i in range(len(children))]
+            PostPad[axis] = [Real(post + str(i), ctx) for i in range(len(children))]
+            return Frames, PrePad, PostPad
+
+        def real(value):
+            return Q(value.numerator, value.denominator, ctx)
+
+        def problem(axis, Frames, PrePad, PostPad):
+            s = Optimize(ctx=ctx)
+            s.set(timeout=self.z3_timeout())
+            for i, view in enumerate(children):
+                s.add(Frames[axis][i] >= 0, PrePad[axis][i] >= 0, PostPad[axis][i] >= 0)
+                # Exact, or a rounded size would not match the positions
+                size = real(exact_size(view, axis))
+                if view.view_mode == ViewMode.Framed:
+                    s.add(Frames[axis][i] == size, Frames[axis][i] != 0)
+                else:
+                    s.add(Or(Frames[axis][i] == 0, Frames[axis][i] == size))
+            return s
+
+        def check(s):
+            result = s.check()
+            statistics = s.statistics()
+            for key in statistics.keys():
+                stats[key] = stats.get(key, 0) + statistics.get_key_value(key)
+            self.objectives += len(s.objectives())
+            return result
+
+        def value(m, var):
+            return m[var].numerator_as_long() / m[var].denominator_as_long()
+
+        def exact_value(m, var):
+            return Fraction(m[var].numerator_as_long(), m[var].denominator_as_long())
+
+        def unframed_count(Frames, axis):
+            return Sum([If(Frames[axis][i] == 0, 1, 0) for i in unframed])
+
+        def symmetric(PrePad, PostPad, axis):
+            return Sum([If(pre == post, 1, 0) for pre, post in zip(PrePad[axis], PostPad[axis])])
+
+        best = None
+        for alignment in range(3):
+            Alignment = Int('Alignment', ctx)
+            Frames, PrePad, PostPad = variables(minor_axis)
+            s = problem(minor_axis, Frames, PrePad, PostPad)
+            s.add(Alignment == alignment)
+            for i in range(len(children)):
+                self.add_minor(s, i, Alignment, Frames, PrePad, PostPad)
+            objectives = [unframed_count(Frames, minor_axis)] if unframed else []
+            objectives.append(symmetric(PrePad, PostPad, minor_axis))
+            for objective in objectives:
+                s.maximize(objective)
+            result = check(s)
+            if result == unknown:
+                return None
+            if result != sat:
+                continue
+            m = s.model()
+            # Centering comes after symmetric padding in optimize
+            score = [m.eval(objective).as_long() for objective in objectives] + [alignment == 1]
+            if best is None or score > best[0]:
+                best = (score, alignment,
+                        [exact_value(m, frame) for frame in Frames[minor_axis]],
+                        [[value(m, pre), value(m, post)] for pre, post in zip(PrePad[minor_axis], PostPad[minor_axis])])
+        if best is None:
+            return None
+        score, alignment, minor_frames, minor_paddings = best
+        if any(minor_frames[i] != 0 for i in unframed):
+            return None
+
+        Spacing = Real('Spacing', ctx)
+        Frames, PrePad, PostPad = variables(major_axis)
+        s = problem(major_axis, Frames, PrePad, PostPad)
+        s.add(Spacing >= 0)
+        stack_top_left = self.stack_top_left(Spacing, Frames, PrePad, PostPad)
+        s.add(stack_top_left - root.top_left[major_axis] >= -3)
+        for i in range(len(children)):
+            self.add_major(s, i, Spacing, Frames, PrePad, PostPad, stack_top_left)
+        if unframed:
+            s.maximize(unframed_count(Frames, major_axis))
+        if len(children) > 1:
+            size_classes = {}
+            for i, view in enumerate(children):
+                for size in frame_options(view, major_axis):
+                    key = (size, minor_frames[i]) if major_axis == 0 else (minor_frames[i], size)
+                    size_classes.setdefault(key, []).append(Frames[major_axis][i] == real(size))
+            s.maximize(matching_pairs(size_classes, ctx))
+        s.maximize(symmetric(PrePad, PostPad, major_axis))
+        if len(children) > 1:
+            s.maximize(Spacing)
+        if check(s) != sat:
+            return None
+        m = s.model()
+        self.z3_stats = stats
+        frames = []
+        paddings = []
+        for i in range(len(children)):
+            frame = [None, None]
+            frame[major_axis] = value(m, Frames[major_axis][i])
+            frame[minor_axis] = float(minor_frames[i])
+            padding = [None, None]
+            padding[major_axis] = [value(m, PrePad[major_axis][i]), value(m, PostPad[major_axis][i])]
+            padding[minor_axis] = minor_paddings[i]
+            frames.append(frame)
+            paddings.append(padding[0] + padding[1])
+        return StackSolution(alignment, value(m, Spacing), frames, paddings)
+
+    def solve_closed_form(self):
+        '''Computes the optimum directly for the stacks where it is known
+        without search: a single child, or framed children that are evenly
+        spaced and centered along the major axis. Every objective of solve()
+        reaches its upper bound on these, so the result is as good as z3's.
+        Arithmetic is exact so the values match what z3 would report.
+        Returns None when no closed form applies.
+        '''
+        root = self.views[0]
+        children = self.views[1:]
+        if len(children) == 0:
+            return None
+        major_axis = int(root.view_type)
+        minor_axis = (major_axis + 1) % 2
+
+        def dist(a, b):
+            return exact(b) - exact(a)
+
+        lead = [dist(root.top_left[minor_axis], view.top_left[minor_axis]) for view in children]
+        trail = [dist(view.bot_right[minor_axis], root.bot_right[minor_axis]) for view in children]
+        before = dist(root.top_left[major_axis], children[0].top_left[major_axis])
+        after = dist(children[-1].bot_right[major_axis], root.bot_right[major_axis])
+        gaps = [dist(a.bot_right[major_axis], b.top_left[major_axis]) for a, b in zip(children, children[1:])]
+        if min(lead + trail + gaps + [before, after]) < 0:
+            return None
+
+        def gen_padding(major_pad, minor_pad):
+            padding = [None, None]
+            padding[major_axis] = major_pad
+            padding[minor_axis] = minor_pad
+            return [float(p) for p in padding[0] + padding[1]]
+
+        # A lone unframed child fills the stack, only padding is left
+        if len(children) == 1 and children[0].view_mode == ViewMode.Unframed:
+            return StackSolution(1, 0.0, [[0.0, 0.0]],
+                                 [gen_padding([before, after], [lead[0], trail[0]])])
+
+        for view in children:
+            if view.view_mode != ViewMode.Framed or view.size(0) <= 0 or view.size(1) <= 0:
+                return None
+        if len(children) == 1:
+            spacing = Fraction(0)
+            # Only the difference of the two paddings is fixed
+            major_pads = [[max(before - after, 0), max(after - before, 0)]]
+        elif before == after and len(set(gaps)) == 1:
+            spacing = gaps[0]
+            major_pads = [[0, 0] for view in children]
+        else:
+            return None
+
+        # Leading alignment keeps every minor padding symmetric, so it only
+        # loses to center alignment when all children are centered.
+        alignment = 1 if lead == trail else 0
+        frames = [[float(dist(view.top_left[0], view.bot_right[0])),
+                   float(dist(view.top_left[1], view.bot_right[1]))] for view in children]
+        paddings = [gen_padding(major_pad, [l, l]) for major_pad, l in zip(major_pads, lead)]
+        return StackSolution(alignment, float(spacing), frames, paddings)
+
+    def solve_fallback(self):
+        '''A layout that reproduces the geometry without any search: every child
+        is framed to its size, the gaps along the major axis become padding and
+        the minor axis is leading aligned.
+        '''
+        root = self.views[0]
+        children = self.views[1:]
+        major_axis = int(root.view_type)
+        minor_axis = (major_axis + 1) % 2
+        frames = []
+        paddings = []
+        last = root.top_left[major_axis]
+        for i, view in enumerate(children):
+            padding = [None, None]
+            after = root.bot_right[major_axis] - view.bot_right[major_axis] if i == len(children) - 1 else 0
+            padding[major_axis] = [max(view.top_left[major_axis] - last, 0), max(after, 0)]
+            padding[minor_axis] = [max(view.top_left[minor_axis] - root.top_left[minor_axis], 0),
+                                   max(root.bot_right[minor_axis] - view.bot_right[minor_axis], 0)]
+            last = view.bot_right[major_axis]
+            frames.append([view.size(0), view.size(1)])
+            paddings.append(padding[0] + padding[1])
+        return StackSolution(0, 0, frames, paddings, SolveStatus.Fallback)
 
-    def verify(self):
-        constrained_views = self.constraint_to_coords()
-        return constrained_views == self.views
+    def verify(self, tolerance=0.5):
+        '''Whether the solved constraints lay every child out within tolerance
+        points of where it was drawn. Needs NumPy, see store.py.
+        '''
+        from verify import verify_stack
+        return verify_stack(self.views, tolerance).ok
 
     # Outputs a list of views in the same format as the input
     def constraint_to_coords(self):
@@ -1,7 +1,8 @@
 from view import *
 from constraint_solver import *
-from functools import reduce
-import statistics
+from collections import deque
+import time
+import math
 from copy import deepcopy
 
 class Hierarchy(View):
@@ -36,24 +37,123 @@ class Hierarchy(View):
             for view in self.views:
                 view.bot_right[self.axis] = view.top_left[self.axis] + self.mean
 
+    __slots__ = ('children',)
+
     def __init__(self, top_left, bot_right, view_type=ViewType.VStack, children=[]):
         super().__init__(top_left, bot_right, view_type)
         self.children = children
 
+    def iter_dfs(self, depth=0):
+        '''Yields (view, depth) for this hierarchy and everything in it, depth
+        first with parents before children. Uses an explicit stack, so deep
+        trees do not hit the recursion limit.
+        '''
+        pending = [(self, depth)]
+        while pending:
+            view, level = pending.pop()
+            yield view, level
+            if isinstance(view, Hierarchy):
+                pending.extend((child, level + 1) for child in reversed(view.children))
+
+    def iter_bfs(self, depth=0):
+        '''Yields (view, depth) for this hierarchy and everything in it, one
+        level at a time.
+        '''
+        pending = deque([(self, depth)])
+        while pending:
+            view, level = pending.popleft()
+            yield view, level
+            if isinstance(view, Hierarchy):
+                pending.extend((child, level + 1) for child in view.children)
+
+    def iter_leaves(self):
+        '''Yields every view that is not a hierarchy, in drawing order.'''
+        for view, depth in self.iter_dfs():
+            if not isinstance(view, Hierarchy):
+                yield view
+
+    def iter_stacks(self, depth=0):
+        '''Yields (stack, depth) for this hierarchy and every nested one,
+        parents first.
+        '''
+        for view, level in self.iter_dfs(depth):
+            if isinstance(view, Hierarchy):
+                yield view, level
+
     def flatlist(self):
-        l = [child.flatlist() if isinstance(child, Hierarchy) else [child] for child in self.children]
-        return reduce(lambda a, b: a + b, l)
+        return list(self.iter_leaves())
 
-    def solve(self):
-        ConstraintSolver([self] + self.children).solve()
-        for child in self.children:
-            if isinstance(child, Hierarchy):
-                child.solve()
+    def stacks(self):
+        '''Returns this hierarchy and every nested hierarchy, parents first.'''
+        return [stack for stack, depth in self.iter_stacks()]
 
-    def cleanse(self):
+    def solve(self, processes=None, executor=None, cache=None, session=None, timeout=None, budget=None,
+              profiler=None, backend=None):
+        '''Solves every stack in the hierarchy. Each stack only reads the
+        geometry of itself and its children, so stacks are independent and can
+        be solved in parallel by passing a number of processes or an existing
+        executor. The parallel path gives the same constraints as the serial one.
+        An optional SolveCache is consulted before solving any stack, and an
+        optional SolverSession is reused by the serial path.
+
+        timeout limits the seconds spent on each stack and budget the seconds
+        spent on the whole hierarchy. Stacks that run out of time get the best
+        answer found so far, or a fallback layout. Returns the worst
+        SolveStatus of any stack. A SolveProfiler gets a record per stack.
+        backend picks what solves each stack, see Z3Backend.
+        '''
+        deadline = None if budget is None else time.time() + budget
+        status = SolveStatus.Optimal
+        if processes is None and executor is None:
+            for stack, depth in self.iter_stacks():
+                solver = ConstraintSolver([stack] + stack.children, cache=cache, session=session,
+                                          timeout=stack_timeout(timeout, deadline), backend=backend)
+                solution = solver.solve()
+                if profiler is not None:
+                    profiler.record(solution.stats, depth)
+                status = max(status, solution.status)
+            return status
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(processes) as pool:
+                return self.solve(executor=pool, cache=cache, timeout=timeout, budget=budget,
+                                  profiler=profiler, backend=backend)
+        stacks = []
+        for stack, depth in self.iter_stacks():
+            solution = cache.get([stack] + stack.children) if cache is not None else None
+            if solution is None:
+                stacks.append((stack, depth))
+            else:
+                solution.apply([stack] + stack.children)
+                if profiler is not None:
+                    profiler.record(None, depth)
+        # Only ship detached copies of each level, not whole subtrees
+        jobs = [executor.submit(solve_stack, [View.deepcopy(view) for view in [stack] + stack.children],
+                                timeout, deadline, backend)
+                for stack, depth in stacks]
+        for (stack, depth), job in zip(stacks, jobs):
+            solution = job.result()
+            if profiler is not None:
+                profiler.record(solution.stats, depth)
+            if cache is not None and solution.status == SolveStatus.Optimal:
+                cache.put([stack] + stack.children, solution)
+            solution.apply([stack] + stack.children)
+            status = max(status, solution.status)
+        return status
+
+    def cleanse(self, vectorized=False):
         '''Cleans the user-inputted data to match what they likely intended to
         draw. General workflow is cleanse -> solve -> to_swiftui
+        vectorized selects the NumPy engine in vectorized_cleanse.
         '''
+        if vectorized:
+            import vectorized_cleanse
+            return vectorized_cleanse.cleanse(self)
+        for stack, depth in self.iter_stacks():
+            stack.cleanse_level()
+
+    def cleanse_level(self):
+        '''Cleanses the children of this stack, but not what is inside them.'''
         # agree on size
         SIZE_TOLERANCE = .2
         for axis in [0, 1]:
@@ -127,12 +227,8 @@ class Hierarchy(View):
                 diff[minor_axis] = center - view.center(minor_axis)
             view.move(diff)
 
-        for child in self.children:
-            if isinstance(child, Hierarchy):
-                child.cleanse()
-
-    def to_swiftui(self):
-        suffix = super().to_swiftui()[len(VIEW_DEFAULT):]
+    def swiftui_header(self, prefix=''):
+        self.truncate_values()
         stackargs = []
         if self.alignment != 1:
             if self.view_type == ViewType.VStack:
@@ -142,54 +238,217 @@ class Hierarchy(View):
         if self.spacing_constraint > 0:
             stackargs.append(f"spacing: {self.spacing_constraint}")
         stacktype = "HStack(" if self.view_type == ViewType.HStack else "VStack("
+        return prefix + stacktype + ', '.join(stackargs) + ') {\n'
 
-        content = '\n'.join([view.to_swiftui() for view in self.children])
-        return stacktype + ', '.join(stackargs) + ') {\n' + content + '\n}' + suffix
+    def verify(self, tolerance=0.5):
+        '''Lays the solved hierarchy out again from its constraints and returns
+        a verify.Verification with the error of every view. Needs NumPy, see
+        store.py.
+        '''
+        import verify
+        return verify.verify(self, tolerance)
+
+    def iter_swiftui(self, indent='', depth=0):
+        '''Follows iter_dfs, closing each stack once the walk has left it, so
+        each token costs the same however deep it is.
+        '''
+        open_stacks = []
+        fresh = True
+        def close():
+            stack, prefix = open_stacks.pop()
+            yield '\n' + prefix + '}'
+            yield from stack.swiftui_modifiers(prefix)
+        for view, level in self.iter_dfs(depth):
+            while len(open_stacks) > level - depth:
+                yield from close()
+                fresh = False
+            if not fresh:
+                yield '\n'
+            if isinstance(view, Hierarchy):
+                prefix = indent * level
+                yield view.swiftui_header(prefix)
+                open_stacks.append((view, prefix))
+                fresh = True
+            else:
+                yield from view.iter_swiftui(indent, level)
+                fresh = False
+        while open_stacks:
+            yield from close()
 
     def deepcopy(self):
-        children = [child.deepcopy() for child in self.children]
-        return Hierarchy(deepcopy(self.top_left), deepcopy(self.bot_right), self.view_type, children=children)
+        # path[d] is the copy of the stack the walk is in at depth d
+        path = []
+        for view, depth in self.iter_dfs():
+            if isinstance(view, Hierarchy):
+                copy = Hierarchy(deepcopy(view.top_left), deepcopy(view.bot_right), view.view_type, children=[])
+            else:
+                copy = view.deepcopy()
+            del path[depth:]
+            if path:
+                path[-1].children.append(copy)
+            path.append(copy)
+        return path[0]
 
     def move(self, diff):
-        super().move(diff)
-        for child in self.children:
-            child.move(diff)
+        for view, depth in self.iter_dfs():
+            View.move(view, diff)
+
+class ViewIndex:
+    '''Sorted orders of a fixed list of views along both axes, computed once
+    and shared by every division of its subsets. Subsets are lists of
+    indices into views.
+    '''
+    def __init__(self, views):
+        self.views = views
+        self.rank = []
+        for axis in range(2):
+            rank = [0] * len(views)
+            for r, i in enumerate(sorted(range(len(views)), key=lambda i: views[i].bot_right[axis])):
+                rank[i] = r
+            self.rank.append(rank)
+
+    def overlaps(self, indices, axis):
+        '''Sorts indices by end along axis and returns them with, after each
+        one, how far the views so far overlap the ones after it. Minima of
+        the remaining tops are precomputed from the back, so this is one
+        linear sweep.
+        '''
+        order = sorted(indices, key=self.rank[axis].__getitem__)
+        tops = [self.views[i].top_left[axis] for i in order]
+        remaining_min = [math.inf] * (len(order) + 1)
+        for k in range(len(order) - 1, -1, -1):
+            remaining_min[k] = min(tops[k], remaining_min[k + 1])
+        # The view added last ends furthest, as views are sorted by end
+        return order, [self.views[i].bot_right[axis] - remaining_min[k + 1] for k, i in enumerate(order)]
+
+    def sections(self, indices, axis, tolerance=0):
+        '''Splits indices into runs along axis wherever every remaining view
+        starts after all views so far have ended, or overlaps them by at most
+        tolerance.
+        '''
+        order, overlaps = self.overlaps(indices, axis)
+        divided = []
+        section = []
+        for i, overlap in zip(order, overlaps):
+            section.append(i)
+            if overlap <= tolerance:
+                divided.append(section)
+                section = []
+        return divided
+
+class HierarchySearch(ViewIndex):
+    '''Finds the hierarchy of least complexity over all decompositions, not
+    just the two that alternate axes from the root. Every subset may be
+    split along either axis, once for every overlap tolerance, and each
+    multi-view section is searched in turn. Results are memoized per subset,
+    and a candidate is abandoned once its complexity reaches the best one
+    found so far for that subset.
+
+    A subset no axis and tolerance can split, such as a view drawn on top of
+    another, is split where the least overlap has to be ignored.
+    '''
+    def __init__(self, views, tolerances=(0,)):
+        super().__init__(views)
+        self.tolerances = tolerances
+        self.best = {}
+        # Complexity a subset is known not to get under
+        self.lower = {}
+        self.visits = 0
+
+    def candidates(self, indices):
+        seen = set()
+        for axis in range(2):
+            for tolerance in self.tolerances:
+                sections = self.sections(indices, axis, tolerance)
+                partition = tuple(frozenset(section) for section in sections)
+                if len(sections) > 1 and partition not in seen:
+                    seen.add(partition)
+                    yield axis, sections
+
+    def unsplittable(self, indices):
+        '''Splits where the fewest points of overlap have to be ignored.'''
+        least = None
+        for axis in range(2):
+            overlaps = self.overlaps(indices, axis)[1][:-1]
+            if least is None or min(overlaps) < least[0]:
+                least = (min(overlaps), axis)
+        return least[1], self.sections(indices, least[1], least[0])
+
+    def build(self, children, axis):
+        top_left = [min([view.top_left[0] for view in children]), min([view.top_left[1] for view in children])]
+        bot_right = [max([view.bot_right[0] for view in children]), max([view.bot_right[1] for view in children])]
+        return Hierarchy(top_left, bot_right, view_type=ViewType(axis), children=children)
+
+    def search(self, indices, bound=math.inf, root_axis=None):
+        '''Returns (hierarchy, complexity) of the simplest hierarchy of indices
+        if its complexity is below bound, otherwise None. The first of equally
+        simple hierarchies wins, so vertical splits win ties. With root_axis,
+        indices are split along that axis if they can be, and the result is
+        not memoized.
+        '''
+        key = frozenset(indices)
+        if root_axis is None and key in self.best:
+            result = self.best[key]
+            return result if result[1] < bound else None
+        if root_axis is None and self.lower.get(key, 0) >= bound:
+            return None
+        self.visits += 1
+        limit = bound
+        best = None
+        candidates = list(self.candidates(indices))
+        if any(axis == root_axis for axis, sections in candidates):
+            candidates = [(axis, sections) for axis, sections in candidates if axis == root_axis]
+        if not candidates:
+            candidates = [self.unsplittable(indices)]
+        for axis, sections in candidates:
+            # Every multi-view section adds at least one
+            complexity = 1 + sum(1 for section in sections if len(section) > 1)
+            if complexity >= bound:
+                continue
+            children = []
+            for section in sections:
+                if len(section) == 1:
+                    children.append(self.views[section[0]])
+                    continue
+                result = self.search(section, bound - complexity + 1)
+                if result is None:
+                    break
+                children.append(result[0])
+                complexity += result[1] - 1
+            else:
+                best = (children, axis, complexity)
+                bound = complexity
+        if best is None:
+            if root_axis is None:
+                self.lower[key] = max(self.lower.get(key, 0), limit)
+            return None
+        children, axis, complexity = best
+        result = (self.build(children, axis), complexity)
+        if root_axis is None:
+            self.best[key] = result
+        return result
 
 def divide_views(views, axis):
-    '''Divides the given views by the axis where possible.
+    '''The simplest hierarchy of the given views that divides them by the
+    axis first, where possible.
     axis: 0 = y, 1 = x
     returns: hiearchy, hierarchy_complexity
     '''
-    views = sorted(views, key=lambda view: view.bot_right[axis])
-    divided = []
-    while len(views) > 0:
-        cur = views.pop(0)
-        section = [cur]
-        while len(views) > 0 and min([view.top_left[axis] for view in views]) < cur.bot_right[axis]:
-            cur = views.pop(0)
-            section.append(cur)
-        divided.append(section)
-
-    hierarchy_complexity = 1
-    children = []
-    for section in divided:
-        if len(section) == 1:
-            children.extend(section)
-        else:
-            sub_root, complexity = divide_views(section, (axis + 1) % 2)
-            children.append(sub_root)
-            hierarchy_complexity += complexity
-    top_left = [min([view.top_left[0] for view in children]), min([view.top_left[1] for view in children])]
-    bot_right = [max([view.bot_right[0] for view in children]), max([view.bot_right[1] for view in children])]
-    root_hierarchy = Hierarchy(top_left, bot_right, view_type=ViewType(axis), children=children)
-    return root_hierarchy, hierarchy_complexity
-
-def infer_hierarchy(views):
-    '''Takes in a flat list of views and infers hierarchy'''
+    search = HierarchySearch(views)
+    if len(views) == 1:
+        return search.build(views, ViewType(axis)), 1
+    return search.search(list(range(len(views))), root_axis=axis)
+
+def infer_hierarchy(views, overlap=0):
+    '''Takes in a flat list of views and infers hierarchy. With overlap, views
+    that overlap by at most that many points may also be split apart.
+    '''
     root = views.pop(0)
-    vert_hierarchy, vert_complexity = divide_views(views, 0)
-    hori_hierarchy, hori_complexity = divide_views(views, 1)
-    (_, hierarchy) = min((vert_complexity, vert_hierarchy), (hori_complexity, hori_hierarchy))
+    search = HierarchySearch(views, (0,) if not overlap else (0, overlap))
+    if len(views) == 1:
+        hierarchy = search.build(views, ViewType.VStack)
+    else:
+        hierarchy, complexity = search.search(list(range(len(views))))
     # We do this to enforce that the root view has the same dimensions as supplied. Otherwise,
     # the default behavior is that the root view will be the smallest it can be such that it can
     # fit all of its subviews.
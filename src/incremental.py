@@ -0,0 +1,42 @@
+from view import *
+from hierarchy import *
+from solve_cache import SolveCache
+from constraint_solver import SolverSession
+
+class IncrementalSolver:
+    '''Keeps the last inferred hierarchy and the solutions of every stack it
+    has solved, so a submit after a small edit only pays for what changed.
+
+    Inference is purely geometric and cheap, so the hierarchy is re-inferred
+    on every change. Solving goes through a SolveCache: stacks whose geometry
+    did not change are answered from it, which leaves only the edited stack
+    and the ancestors whose bounds moved for z3. With reuse_session, those
+    solves also share one SolverSession across submits.
+    '''
+    def __init__(self, cache_size=4096, reuse_session=False, budget=None):
+        self.cache = SolveCache(size=cache_size)
+        self.session = SolverSession() if reuse_session else None
+        # Seconds one submit may spend solving, see Hierarchy.solve
+        self.budget = budget
+        self.status = None
+        self.snapshot = None
+        self.hierarchy = None
+        self.swiftui = None
+
+    @staticmethod
+    def take_snapshot(views):
+        return [(tuple(view.top_left), tuple(view.bot_right), bool(view.view_mode)) for view in views]
+
+    def submit(self, views):
+        '''Takes the canvas view list (root first) and returns the SwiftUI for it.
+        The list and its views are left untouched.
+        '''
+        snapshot = self.take_snapshot(views)
+        if snapshot == self.snapshot:
+            return self.swiftui
+        hierarchy = infer_hierarchy([view.deepcopy() for view in views])
+        self.status = hierarchy.solve(cache=self.cache, session=self.session, budget=self.budget)
+        self.snapshot = snapshot
+        self.hierarchy = hierarchy
+        self.swiftui = hierarchy.to_swiftui()
+        return self.swiftui
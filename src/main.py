@@ -2,26 +2,50 @@ import tkinter as tk
 from tkinter import ttk
 from view import *
 from hierarchy import *
+from incremental import IncrementalSolver
+from recording import Recorder
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
 import pyperclip
+import time
+
+log = logging.getLogger(__name__)
 
 DEFAULT_WIDTH = 375
 DEFAULT_HEIGHT = 667
+# Seconds a submit may spend in the solver before falling back
+SOLVE_BUDGET = 5
+# How often the event loop checks on a background job, in ms
+POLL_INTERVAL = 50
 
 class Canvas(tk.Tk):
-    def __init__(self):
+    def __init__(self, record=None):
         tk.Tk.__init__(self)
         self.dimensions=[DEFAULT_HEIGHT, DEFAULT_WIDTH]
+        # Replay with recording.py
+        self.recorder = Recorder.open(record, self.dimensions) if record is not None else None
         self.x = self.y = 0
+        self.solver = IncrementalSolver(budget=SOLVE_BUDGET)
+        # Inference, cleanse and solve run on this thread so the window stays
+        # responsive. One worker keeps jobs in order, and z3 releases the GIL.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # z3 loads on this thread while the window comes up, not on first submit
+        self.executor.submit(preload)
+        self.job = None
+        # Bumped whenever the drawing changes, results of older jobs are dropped
+        self.generation = 0
         self.frame = tk.Frame(self)
         self.init_menu()
         self.create_canvas()
         self.frame.pack()
+        self.protocol("WM_DELETE_WINDOW", self.close)
 
     def init_menu(self):
         self.bar = tk.Frame(self.frame)
         self.submitbt = tk.Button(self.bar, text="submit", fg="green", command=self.submit)
         self.submitbt.pack(side=tk.LEFT)
-        self.clearbt = tk.Button(self.bar, text="clear", command=self.clear)
+        self.clearbt = tk.Button(self.bar, text="clear", command=self.on_clear)
         self.clearbt.pack(side=tk.LEFT)
         self.snapbt = tk.Button(self.bar, text="snap", command=self.snap)
         self.snapbt.pack(side=tk.LEFT)
@@ -52,9 +76,53 @@ class Canvas(tk.Tk):
         self.height_entry.insert(0, str(DEFAULT_HEIGHT))
         self.height_entry.pack(side=tk.LEFT)
 
+        self.progress = tk.Label(self.bar, text="", width=16, anchor=tk.W)
+        self.progress.pack(side=tk.LEFT)
+
         self.view_mode = ViewMode.Framed
 
+    def run_in_background(self, name, work, done):
+        '''Runs work() on the worker thread and hands its result to done() on
+        the Tk thread through after() callbacks. A job that has not started
+        yet is cancelled when a newer one comes in or the drawing changes.
+        '''
+        self.invalidate()
+        self.job = self.executor.submit(work)
+        self.poll(name, self.generation, self.job, time.monotonic(), done)
+
+    def poll(self, name, generation, job, start, done):
+        if generation != self.generation:
+            return
+        if not job.done():
+            self.progress['text'] = f"{name}... {time.monotonic() - start:.1f}s"
+            self.after(POLL_INTERVAL, self.poll, name, generation, job, start, done)
+            return
+        self.progress['text'] = ""
+        try:
+            result = job.result()
+        except Exception as e:
+            self.progress['text'] = f"{name} failed"
+            log.error('%s failed', name, exc_info=e)
+            return
+        done(result)
+
+    def invalidate(self):
+        self.generation += 1
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.progress['text'] = ""
+
+    def close(self):
+        self.invalidate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.recorder is not None:
+            self.recorder.close()
+        self.destroy()
+
     def undo(self):
+        if self.recorder is not None:
+            self.recorder.undo()
         self.views.pop()
         views = self.views
         self.clear()
@@ -72,23 +140,44 @@ class Canvas(tk.Tk):
     def resize(self):
         self.dimensions=[int(self.height_entry.get()),
                          int(self.width_entry.get())]
+        if self.recorder is not None:
+            self.recorder.resize(self.dimensions)
         self.clear()
 
     def submit(self):
-        hier = infer_hierarchy(self.views)
-        hier.solve()
-        pyperclip.copy(hier.to_swiftui())
+        views = [view.deepcopy() for view in self.views]
+        if self.recorder is not None:
+            self.recorder.submit(views)
+        def work():
+            # Read on the worker, a later job may change the status before done runs
+            swiftui = self.solver.submit(views)
+            return swiftui, self.solver.status
+        def done(result):
+            swiftui, status = result
+            pyperclip.copy(swiftui)
+            if status != SolveStatus.Optimal:
+                self.progress['text'] = f"copied ({status.name.lower()})"
+            else:
+                self.progress['text'] = "copied"
+        self.run_in_background("solving", work, done)
 
     def snap(self):
-        hier = infer_hierarchy(self.views)
-        self.clear()
-        hier.cleanse()
-        self.views.extend(hier.flatlist())
-        for view in self.views[1:]:
-            self.canvas.create_rectangle(view.top_left[1], view.top_left[0],
-                                         view.bot_right[1], view.bot_right[0],
-                                         fill="black" if view.view_mode else
-                                         "white", tags="element")
+        views = [view.deepcopy() for view in self.views]
+        if self.recorder is not None:
+            self.recorder.snap(views)
+        def work():
+            hier = infer_hierarchy(views)
+            hier.cleanse()
+            return hier.flatlist()
+        def done(snapped):
+            self.clear()
+            self.views.extend(snapped)
+            for view in self.views[1:]:
+                self.canvas.create_rectangle(view.top_left[1], view.top_left[0],
+                                             view.bot_right[1], view.bot_right[0],
+                                             fill="black" if view.view_mode else
+                                             "white", tags="element")
+        self.run_in_background("snapping", work, done)
 
     def create_canvas(self):
         self.canvasframe = tk.Frame(self.frame, highlightbackground="black", highlightthickness=1)
@@ -117,14 +206,26 @@ class Canvas(tk.Tk):
 
     def on_button_release(self, event):
         curX, curY = (event.x, event.y)
+        self.invalidate()
         self.views.append(View([min(self.start_y, curY), min(self.start_x, curX)],
                                [max(self.start_y, curY), max(self.start_x, curX)], view_mode=self.view_mode))
+        if self.recorder is not None:
+            self.recorder.draw(self.views[-1])
+
+    def on_clear(self):
+        if self.recorder is not None:
+            self.recorder.clear()
+        self.clear()
 
     def clear(self):
         # Clear the canvas
+        self.invalidate()
         self.canvasframe.destroy()
         self.create_canvas()
 
 if __name__ == "__main__":
-    app = Canvas()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", default=None, help="write the session to this JSONL file")
+    args = parser.parse_args()
+    app = Canvas(record=args.record)
     app.mainloop()
@@ -0,0 +1,237 @@
+'''A mixed-integer linear program backend for ConstraintSolver, solved by
+HiGHS through scipy.optimize.milp. Needs SciPy, which only this module does.
+
+    ConstraintSolver(views, backend=MILPBackend()).solve()
+    hierarchy.solve(backend=MILPBackend())
+
+It models the problem of ConstraintSolver.optimize, but not exactly. z3 is
+given the layout as formulas over the frames, including a division by the
+number of children without a frame. Here the drawn geometry is used
+instead, which makes every constraint linear: consecutive children are
+apart by their paddings and the spacing, a stack with a child without a
+frame fills its root, one without is centered in it, and such children all
+share one size. Each frame is 0 or the child's size, so it is a binary, and
+so are the alignment, every symmetric padding and which size class each
+child is in. Indicator constraints are written with a big M.
+
+HiGHS holds equalities only to its feasibility tolerance, and a binary
+only to its integrality tolerance, which the big M scales up. So paddings
+that differ by about 1e-6, or a child that is that far off center, count
+as symmetric or centered here where z3's exact arithmetic says they are
+not. The layout reproduces the drawn geometry to within 1e-5 rather
+than exactly, and the objectives are at least as good as z3's when
+compared to that tolerance, often better. On integer coordinates the two
+agree exactly. Use it where float noise in the sketch is expected, see
+`bench.py backends`.
+
+The objectives are optimized one after another in optimize's order, each
+one fixed at its optimum before the next. solver.time_left() covers all
+of them; running out keeps the best answer of the last objective finished.
+'''
+from constraint_solver import *
+import numpy as np
+import time
+
+class MILPProblem:
+    '''Variables, linear constraints and objectives in the form
+    scipy.optimize.milp takes them. Variables are numbered as they are
+    added, constraints and objectives are {variable: coefficient} dicts.
+    '''
+    def __init__(self):
+        self.lower = []
+        self.upper = []
+        self.integral = []
+        self.rows = []
+        self.row_lower = []
+        self.row_upper = []
+
+    def var(self, lower=0, upper=np.inf, binary=False):
+        self.lower.append(lower)
+        self.upper.append(upper)
+        self.integral.append(1 if binary else 0)
+        return len(self.lower) - 1
+
+    def binary(self, lower=0, upper=1):
+        return self.var(lower, upper, binary=True)
+
+    def add(self, terms, lower=-np.inf, upper=np.inf):
+        self.rows.append(terms)
+        self.row_lower.append(lower)
+        self.row_upper.append(upper)
+
+    def equal(self, terms, value):
+        self.add(terms, value, value)
+
+    def solve(self, objective, maximize, time_limit=None):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+        c = np.zeros(len(self.lower))
+        for var, coefficient in objective.items():
+            c[var] = -coefficient if maximize else coefficient
+        A = np.zeros((len(self.rows), len(self.lower)))
+        for row, terms in enumerate(self.rows):
+            for var, coefficient in terms.items():
+                A[row, var] += coefficient
+        options = {} if time_limit is None else {'time_limit': max(time_limit, 0.001)}
+        return milp(c, integrality=np.array(self.integral), bounds=Bounds(self.lower, self.upper),
+                    constraints=LinearConstraint(A, self.row_lower, self.row_upper), options=options)
+
+def value(result, terms):
+    return sum(coefficient * result.x[var] for var, coefficient in terms.items())
+
+class MILPBackend:
+    '''Solves stacks as a MILP, see the module docstring and Z3Backend.'''
+    name = 'milp'
+
+    def solve(self, solver):
+        views = solver.views
+        root = views[0]
+        children = views[1:]
+        n = len(children)
+        if n == 0:
+            return None
+        major_axis = int(root.view_type)
+        minor_axis = (major_axis + 1) % 2
+        p = MILPProblem()
+
+        def offsets(axis):
+            return ([view.top_left[axis] - root.top_left[axis] for view in children],
+                    [root.bot_right[axis] - view.bot_right[axis] for view in children])
+        lead, trail = offsets(minor_axis)
+        before, after = offsets(major_axis)
+        # Large enough to switch off any constraint between these numbers
+        M = 4 * max([root.size(0), root.size(1)] + [abs(x) for x in lead + trail + before + after]) + 10
+
+        spacing = p.var(upper=root.size(major_axis))
+        pre, post, zero = [None, None], [None, None], [None, None]
+        for axis in range(2):
+            pre[axis] = [p.var(upper=M) for view in children]
+            post[axis] = [p.var(upper=M) for view in children]
+            zero[axis] = []
+            for view in children:
+                if view.view_mode == ViewMode.Framed:
+                    if view.size(axis) <= 0:
+                        return None
+                    zero[axis].append(p.binary(upper=0))
+                else:
+                    # Both options are 0 when the child has no size
+                    zero[axis].append(p.binary(lower=1 if view.size(axis) == 0 else 0))
+
+        # Major axis
+        for i in range(1, n):
+            gap = children[i].top_left[major_axis] - children[i - 1].bot_right[major_axis]
+            p.equal({pre[major_axis][i]: 1, post[major_axis][i - 1]: 1, spacing: 1}, gap)
+        first, last = pre[major_axis][0], post[major_axis][n - 1]
+        # The stack starts as far from the root's start as it ends from its end
+        p.equal({first: -1, last: 1}, after[-1] - before[0])
+        p.add({first: 1}, upper=before[0] + 3)
+        fills = p.binary()
+        p.add({fills: 1, **{z: -1 for z in zero[major_axis]}}, upper=0)
+        for z in zero[major_axis]:
+            p.add({fills: 1, z: -1}, lower=0)
+        # A stack with a child without a frame fills the root
+        p.add({first: 1, fills: M}, upper=before[0] + M)
+        p.add({first: 1, fills: -M}, lower=before[0] - M)
+        # Sizes are exact, so they group like z3's
+        shares = {}
+        for i, view in enumerate(children):
+            if view.view_mode == ViewMode.Unframed:
+                size = exact_size(view, major_axis)
+                if size not in shares:
+                    shares[size] = p.binary()
+                p.add({zero[major_axis][i]: 1, shares[size]: -1}, upper=0)
+        p.add({share: 1 for share in shares.values()}, upper=1)
+
+        # Minor axis
+        alignment = [p.binary() for i in range(3)]
+        p.equal({a: 1 for a in alignment}, 1)
+        def when(terms, target, switches):
+            # terms == target while every binary of switches, given as
+            # {var: sign}, is on. A sign of -1 means on is 0.
+            on = sum(1 for sign in switches.values() if sign > 0)
+            p.add({**terms, **{var: M * sign for var, sign in switches.items()}}, upper=target + M * on)
+            p.add({**terms, **{var: -M * sign for var, sign in switches.items()}}, lower=target - M * on)
+        for i in range(n):
+            z = zero[minor_axis][i]
+            pre_i, post_i = pre[minor_axis][i], post[minor_axis][i]
+            when({pre_i: 1}, lead[i], {z: 1})
+            when({post_i: 1}, trail[i], {z: 1})
+            when({pre_i: 1}, lead[i], {z: -1, alignment[0]: 1})
+            when({pre_i: 1, post_i: -1}, lead[i] - trail[i], {z: -1, alignment[1]: 1})
+            when({post_i: 1}, trail[i], {z: -1, alignment[2]: 1})
+
+        symmetric = []
+        for axis in [minor_axis, major_axis]:
+            for pre_i, post_i in zip(pre[axis], post[axis]):
+                s = p.binary()
+                when({pre_i: 1, post_i: -1}, 0, {s: 1})
+                symmetric.append(s)
+
+        # Matching frames, counted per size class as optimize does
+        classes = {}
+        for i, view in enumerate(children):
+            options = [[1] if view.view_mode == ViewMode.Unframed and view.size(axis) == 0 else
+                       [0] if view.view_mode == ViewMode.Framed else [0, 1] for axis in range(2)]
+            for height in options[0]:
+                for width in options[1]:
+                    key = (0 if height else exact_size(view, 0), 0 if width else exact_size(view, 1))
+                    # Only on when child i takes both options
+                    member = p.binary()
+                    for axis, option in enumerate([height, width]):
+                        if option:
+                            p.add({member: 1, zero[axis][i]: -1}, upper=0)
+                        else:
+                            p.add({member: 1, zero[axis][i]: 1}, upper=1)
+                    classes.setdefault(key, []).append(member)
+        matching = {}
+        for members in classes.values():
+            # A class of k children holds t - 1 more pairs for every t up to k
+            for t in range(2, len(members) + 1):
+                reached = p.binary()
+                p.add({reached: t, **{member: -1 for member in members}}, upper=0)
+                matching[reached] = t - 1
+
+        objectives = []
+        if any(view.view_mode == ViewMode.Unframed for view in children):
+            objectives.append(({zero[axis][i]: 1 for axis in range(2) for i, view in enumerate(children)
+                                if view.view_mode == ViewMode.Unframed}, True))
+        if n > 1:
+            objectives.append((matching, True))
+        objectives.append(({s: 1 for s in symmetric}, True))
+        objectives.append(({alignment[1]: 1}, True))
+        if n > 1:
+            objectives.append(({spacing: 1}, True))
+
+        left = solver.time_left()
+        deadline = None if left is None else time.perf_counter() + left
+        best = None
+        status = SolveStatus.Optimal
+        for k, (objective, maximize) in enumerate(objectives):
+            time_limit = None if deadline is None else deadline - time.perf_counter()
+            result = p.solve(objective, maximize, time_limit)
+            if result.x is None:
+                if best is None:
+                    return None
+                status = SolveStatus.Feasible
+                break
+            best = result
+            if result.status != 0:
+                status = SolveStatus.Feasible
+                break
+            # Integer objectives, all but the spacing
+            optimum = round(value(result, objective))
+            if maximize:
+                p.add(objective, lower=optimum - 0.5)
+            else:
+                p.add(objective, upper=optimum + 0.5)
+        solver.objectives = len(objectives)
+
+        x = best.x
+        def get(var):
+            return round(float(x[var]), 6)
+        frames = []
+        paddings = []
+        for i, view in enumerate(children):
+            # Exact like z3's frames, view.size can round
+            frames.append([0.0 if x[zero[axis][i]] > 0.5 else float(exact_size(view, axis)) for axis in range(2)])
+            paddings.append([get(pre[0][i]), get(post[0][i]), get(pre[1][i]), get(post[1][i])])
+        return StackSolution(int(np.argmax([x[a] for a in alignment])), get(spacing), frames, paddings, status)
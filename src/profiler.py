@@ -0,0 +1,44 @@
+import json
+
+class SolveProfiler:
+    '''Collects one record per solved stack: its depth in the hierarchy, how it
+    was solved (cache, closed_form, decomposed, the backend's name such as z3
+    or milp, or fallback), its SolveStatus, wall time, number of objectives
+    and z3's own statistics such as conflicts, decisions and memory. Pass
+    one to Hierarchy.solve.
+
+    callback, if given, is called with every record as it comes in, so slow
+    layouts can be forwarded to whatever tracks them.
+    '''
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = []
+
+    def record(self, stats, depth):
+        # Stacks answered from a cache before reaching a solver carry no stats
+        record = dict(stats) if stats is not None else {'method': 'cache', 'seconds': 0.0, 'objectives': 0, 'z3': None}
+        record['stack'] = len(self.records)
+        record['depth'] = depth
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        return record
+
+    def report(self, slowest=5):
+        '''Totals per solve method and the slowest stacks.'''
+        methods = {}
+        for record in self.records:
+            total = methods.setdefault(record['method'], {'stacks': 0, 'seconds': 0.0})
+            total['stacks'] += 1
+            total['seconds'] += record['seconds']
+        return {'stacks': len(self.records),
+                'seconds': sum(record['seconds'] for record in self.records),
+                'methods': methods,
+                'slowest': sorted(self.records, key=lambda record: -record['seconds'])[:slowest]}
+
+    def to_json(self, **kwargs):
+        return json.dumps({'report': self.report(), 'records': self.records}, **kwargs)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json(indent=2))
@@ -0,0 +1,174 @@
+'''Recording and replay of canvas sessions.
+
+A recording is a JSONL file with one event per line, written as the
+designer works: {"t": seconds since the start, "event": name, ...}. Views
+are stored as [top, left, bottom, right, framed] to keep files small.
+
+    start   {"dimensions": [height, width]}
+    draw    {"view": view}
+    undo, clear
+    resize  {"dimensions": [height, width]}
+    snap    {"views": [root, view, ...]}
+    submit  {"views": [root, view, ...]}
+
+Replaying runs every snap and submit again without a window, the way the
+Canvas runs them: a snap is infer_hierarchy and cleanse, a submit is
+infer_hierarchy, solve and to_swiftui. Each one is timed per stage.
+
+    python main.py --record session.jsonl
+    python recording.py session.jsonl other.jsonl --timeout 5
+'''
+from view import *
+from hierarchy import *
+import argparse
+import json
+import time
+
+def encode_view(view):
+    return [*view.top_left, *view.bot_right, int(bool(view.view_mode))]
+
+def decode_view(data):
+    top, left, bottom, right, framed = data
+    return View([top, left], [bottom, right], view_mode=ViewMode.Framed if framed else ViewMode.Unframed)
+
+class Recorder:
+    '''Appends events to a recording as they happen. Each line is flushed, so
+    a session cut short by a crash is still readable.
+    '''
+    def __init__(self, f, dimensions):
+        self.f = f
+        self.start = time.monotonic()
+        self.write('start', dimensions=list(dimensions))
+
+    @staticmethod
+    def open(path, dimensions):
+        return Recorder(open(path, 'w'), dimensions)
+
+    def write(self, event, **data):
+        data = {'t': round(time.monotonic() - self.start, 3), 'event': event, **data}
+        self.f.write(json.dumps(data, separators=(',', ':')) + '\n')
+        self.f.flush()
+
+    def draw(self, view):
+        self.write('draw', view=encode_view(view))
+
+    def undo(self):
+        self.write('undo')
+
+    def clear(self):
+        self.write('clear')
+
+    def resize(self, dimensions):
+        self.write('resize', dimensions=list(dimensions))
+
+    def snap(self, views):
+        self.write('snap', views=[encode_view(view) for view in views])
+
+    def submit(self, views):
+        self.write('submit', views=[encode_view(view) for view in views])
+
+    def close(self):
+        self.f.close()
+
+def read_recording(f):
+    '''Yields the events of an open recording as dicts.'''
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+def snap_step(views):
+    times = {}
+    start = time.perf_counter()
+    hierarchy = infer_hierarchy(views)
+    times['infer'] = time.perf_counter() - start
+    start = time.perf_counter()
+    hierarchy.cleanse()
+    times['cleanse'] = time.perf_counter() - start
+    return hierarchy, times
+
+def submit_step(views, timeout=None, budget=None):
+    times = {}
+    start = time.perf_counter()
+    hierarchy = infer_hierarchy(views)
+    times['infer'] = time.perf_counter() - start
+    start = time.perf_counter()
+    status = hierarchy.solve(timeout=timeout, budget=budget)
+    times['solve'] = time.perf_counter() - start
+    start = time.perf_counter()
+    hierarchy.to_swiftui()
+    times['to_swiftui'] = time.perf_counter() - start
+    return hierarchy, status, times
+
+def replay(events, timeout=None, budget=None):
+    '''Runs the snaps and submits of a recording again and returns one result
+    per step, in order. Draws, undos, clears and resizes only update the
+    replayed view list, which a snap replaces like the Canvas does. A snap
+    or submit without its own views uses that list.
+    '''
+    results = []
+    dimensions = None
+    views = []
+    for step, event in enumerate(events):
+        kind = event['event']
+        if kind == 'start' or kind == 'resize':
+            dimensions = event['dimensions']
+            views = [View([0, 0], list(dimensions))]
+        elif kind == 'clear':
+            views = [View([0, 0], list(dimensions))]
+        elif kind == 'draw':
+            views.append(decode_view(event['view']))
+        elif kind == 'undo':
+            if len(views) > 1:
+                views.pop()
+        elif kind == 'snap' or kind == 'submit':
+            if 'views' in event:
+                recorded = [decode_view(view) for view in event['views']]
+            else:
+                recorded = [view.deepcopy() for view in views]
+            result = {'step': step, 'event': kind, 't': event['t'], 'views': len(recorded) - 1}
+            if kind == 'snap':
+                hierarchy, times = snap_step(recorded)
+                views = [View([0, 0], list(dimensions))] + hierarchy.flatlist()
+            else:
+                hierarchy, status, times = submit_step(recorded, timeout, budget)
+                result['status'] = status.name
+            result['seconds'] = times
+            result['total'] = sum(times.values())
+            results.append(result)
+    return results
+
+def summary(results):
+    '''Step count and the total and slowest time per kind of step.'''
+    kinds = {}
+    for result in results:
+        kind = kinds.setdefault(result['event'], {'steps': 0, 'total': 0.0, 'slowest': 0.0})
+        kind['steps'] += 1
+        kind['total'] += result['total']
+        kind['slowest'] = max(kind['slowest'], result['total'])
+    return kinds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recordings', nargs='+', help='JSONL recordings to replay')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per stack')
+    parser.add_argument('--budget', type=float, default=None, help='seconds per submit')
+    parser.add_argument('-o', '--output', default=None, help='write every step result to this JSON file')
+    args = parser.parse_args(argv)
+    report = {}
+    for path in args.recordings:
+        with open(path) as f:
+            results = replay(read_recording(f), args.timeout, args.budget)
+        report[path] = results
+        print(path)
+        print('  step  event   views  seconds  stages')
+        for result in results:
+            stages = '  '.join(f'{stage} {seconds:.4f}' for stage, seconds in result['seconds'].items())
+            print(f'  {result["step"]:4d}  {result["event"]:6s}  {result["views"]:5d}  {result["total"]:7.4f}  {stages}')
+        for kind, total in summary(results).items():
+            print(f'  {kind}: {total["steps"]} steps, {total["total"]:.4f}s total, {total["slowest"]:.4f}s slowest')
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
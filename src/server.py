@@ -0,0 +1,290 @@
+'''Local layout-solving service.
+
+Accepts sketches over HTTP and answers with SwiftUI and the solved
+constraints, so several design tools can share one pool of solvers.
+
+    POST /solve    {"views": [...], "cleanse": true, "timeout": null}
+    GET  /metrics  queue depth, batch and latency statistics
+
+Views are written as View.to_dict does, root first. Requests that arrive
+close together are split over the idle workers of a process pool, one
+batch per worker, so batching never leaves a worker idle. Workers import
+z3 and keep a SolveCache when they start, so a request never pays for a
+cold worker. Only the standard library and the solver's own dependencies
+are used.
+
+    python server.py --port 8291 --workers 4
+'''
+from view import *
+from hierarchy import *
+from solve_cache import SolveCache
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import os
+import queue
+import statistics
+import threading
+import time
+
+# Per-process cache of the pool workers, set up by warm_worker
+worker_cache = None
+
+def warm_worker(cache_size):
+    '''Pool initializer: imports z3 and solves a trivial stack so the first
+    real request finds everything loaded.
+    '''
+    global worker_cache
+    worker_cache = SolveCache(size=cache_size)
+    # The stack below is solved in closed form, which never loads z3
+    preload()
+    solve_stack([View([0, 0], [20, 10], ViewType.VStack), View([0, 0], [10, 10]), View([10, 0], [20, 10])])
+
+def number(value):
+    return None if value is None else float(value)
+
+def stack_constraints(hierarchy):
+    '''The solved constraints of every stack, parents first.'''
+    constraints = []
+    for stack in hierarchy.stacks():
+        children = []
+        for child in stack.children:
+            frame = child.frame_constraint
+            children.append({'frame': None if frame is None else [number(f) for f in frame],
+                             'padding': [[number(p) for p in axis] for axis in child.padding_constraint]})
+        constraints.append({'view_type': stack.view_type.name,
+                            'top_left': [number(p) for p in stack.top_left],
+                            'bot_right': [number(p) for p in stack.bot_right],
+                            'alignment': stack.alignment,
+                            'spacing': number(stack.spacing_constraint),
+                            'children': children})
+    return constraints
+
+def solve_request(request):
+    '''Runs infer -> cleanse -> solve -> to_swiftui for one request dict.'''
+    start = time.perf_counter()
+    hierarchy = infer_hierarchy([View.from_dict(view) for view in request['views']])
+    if request.get('cleanse', True):
+        hierarchy.cleanse()
+    status = hierarchy.solve(cache=worker_cache, timeout=request.get('timeout'))
+    return {'swiftui': hierarchy.to_swiftui(),
+            'constraints': stack_constraints(hierarchy),
+            'status': status.name,
+            'seconds': time.perf_counter() - start}
+
+def solve_batch(requests):
+    '''Solves a batch in one worker. Errors are returned per request.'''
+    results = []
+    for request in requests:
+        try:
+            results.append(solve_request(request))
+        except Exception as e:
+            results.append({'error': f'{type(e).__name__}: {e}'})
+    return results
+
+class Dispatcher:
+    '''Collects requests from any number of handler threads and sends them to
+    the pool in batches. A batch is only cut when a worker is free: requests
+    that arrived within batch_window seconds of the first one, or while every
+    worker was busy, are split evenly over the free workers, at most
+    batch_size to a batch.
+    '''
+    def __init__(self, workers=None, batch_size=8, batch_window=0.005, cache_size=4096, history=1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers, initializer=warm_worker, initargs=(cache_size,))
+        # One permit per worker without a batch
+        self.idle = threading.Semaphore(self.workers)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batch_sizes = []
+        self.latencies = []
+        self.history = history
+        self.thread = threading.Thread(target=self.dispatch, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        '''Queues a request dict and returns a Future of its result dict.'''
+        future = Future()
+        self.queue.put((request, future, time.perf_counter()))
+        return future
+
+    def collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        deadline = time.perf_counter() + self.batch_window
+        while len(pending) < self.batch_size * self.workers:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            pending.append(item)
+        return pending
+
+    def drain(self, pending):
+        '''Adds whatever is queued to pending without waiting.'''
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is None:
+                self.queue.put(None)
+                return
+            pending.append(item)
+
+    def dispatch(self):
+        pending = []
+        while True:
+            if not pending:
+                pending = self.collect()
+                if pending is None:
+                    return
+            self.idle.acquire()
+            # Requests that came in while every worker was busy
+            self.drain(pending)
+            free = 1
+            while free < len(pending) and self.idle.acquire(blocking=False):
+                free += 1
+            size = min(math.ceil(len(pending) / free), self.batch_size)
+            for i in range(free):
+                batch, pending = pending[:size], pending[size:]
+                if batch:
+                    self.send(batch)
+                else:
+                    self.idle.release()
+
+    def send(self, batch):
+        with self.lock:
+            self.in_flight += len(batch)
+            self.batches += 1
+            self.batch_sizes = (self.batch_sizes + [len(batch)])[-self.history:]
+        job = Future()
+        try:
+            job = self.pool.submit(solve_batch, [request for request, future, queued in batch])
+        except Exception as e:
+            # A broken pool fails the batch instead of stopping the dispatcher
+            job.set_exception(e)
+        job.add_done_callback(lambda job, batch=batch: self.finish(batch, job))
+
+    def finish(self, batch, job):
+        self.idle.release()
+        try:
+            results = job.result()
+        except Exception as e:
+            results = [{'error': f'{type(e).__name__}: {e}'}] * len(batch)
+        now = time.perf_counter()
+        with self.lock:
+            self.in_flight -= len(batch)
+            for (request, future, queued), result in zip(batch, results):
+                self.requests += 1
+                if 'error' in result:
+                    self.errors += 1
+                self.latencies.append(now - queued)
+            self.latencies = self.latencies[-self.history:]
+        for (request, future, queued), result in zip(batch, results):
+            future.set_result(result)
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = {'queue_depth': self.queue.qsize(),
+                       'in_flight': self.in_flight,
+                       'requests': self.requests,
+                       'errors': self.errors,
+                       'workers': self.workers,
+                       'batches': self.batches,
+                       'mean_batch_size': statistics.mean(self.batch_sizes) if self.batch_sizes else 0}
+        if latencies:
+            metrics['latency'] = {'mean': statistics.mean(latencies),
+                                  'p50': latencies[len(latencies) // 2],
+                                  'p95': latencies[min(int(len(latencies) * .95), len(latencies) - 1)],
+                                  'max': latencies[-1]}
+        return metrics
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.pool.shutdown()
+
+class SolveHandler(BaseHTTPRequestHandler):
+    def send_json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.dispatcher.metrics())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/solve':
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if isinstance(request, list):
+                request = {'views': request}
+            if not isinstance(request, dict) or not isinstance(request.get('views'), list):
+                raise ValueError('expected a list of views')
+        except ValueError as e:
+            self.send_json(400, {'error': f'{type(e).__name__}: {e}'})
+            return
+        result = self.server.dispatcher.submit(request).result()
+        self.send_json(500 if 'error' in result else 200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+class SolveServer(ThreadingHTTPServer):
+    '''HTTP server with a Dispatcher. Port 0 picks a free port, see
+    server_address. Keyword arguments are passed on to Dispatcher.
+    '''
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, **dispatcher_args):
+        super().__init__((host, port), SolveHandler)
+        self.dispatcher = Dispatcher(**dispatcher_args)
+
+    def server_close(self):
+        super().server_close()
+        self.dispatcher.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8291)
+    parser.add_argument('--workers', type=int, default=None, help='size of the process pool')
+    parser.add_argument('--batch-size', type=int, default=8, help='most requests sent to a worker at once')
+    parser.add_argument('--batch-window', type=float, default=0.005,
+                        help='seconds to wait for a batch to fill')
+    args = parser.parse_args(argv)
+    server = SolveServer(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                         batch_window=args.batch_window)
+    print(f'Serving on http://{server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+'''Solving one sketch for several screen sizes.
+
+Each stack is laid out at every size with one set of frames, one spacing
+and one alignment. Only the paddings are per size, and children without a
+frame take whatever room is left at each size. At the drawn size the stack
+reproduces its drawing exactly, as ConstraintSolver.optimize asks. At every
+other size it has to fit its root: paddings are not negative, children
+without a frame along the major axis keep a size of at least 0, a stack
+with none of those overflows by at most the 3 points optimize allows on
+either side, and every child fits across the minor axis. The objectives
+are optimize's, at the drawn size, and then that as few paddings as
+possible differ from the drawn ones. The paddings that do differ are the
+constraints that depend on the size.
+
+The drawn size is solved first, as Hierarchy.solve does. Where that
+solution fits every size, it is also the best joint one, and each size
+only changes the paddings it must, largest first. A stack it does not fit
+is solved for all sizes at once as one z3 problem, JointSolver. A stack
+that no shared frames and spacing fit is solved for each such size on its
+own, from its drawing stretched to the size.
+
+Stacks are handled parents first. A stack's box at each size is where its
+parent's constraints lay it out there.
+
+    python sizes.py sketch.json --sizes 375x667 390x844 428x926
+
+Sizes are width x height in points, as device sizes are usually written.
+sketch.json holds a list of views as View.to_dict writes them, root first.
+Inside the package sizes are [height, width] like Canvas.dimensions.
+'''
+from view import *
+from hierarchy import *
+from verify import verify_stack
+import argparse
+import json
+import sys
+
+# Points of overflow that count as fitting, float sums of a drawn layout can be off by this
+EPSILON = 1e-9
+
+def stretch(view, box, drawn):
+    '''Moves view from inside the box drawn to the same place inside box,
+    stretched along each axis. Boxes are (top_left, bot_right).
+    '''
+    scale = [(b - t) / (db - dt) if db != dt else 1 for t, b, dt, db in zip(*box, *drawn)]
+    view.top_left = [t + (p - dt) * s for p, t, dt, s in zip(view.top_left, box[0], drawn[0], scale)]
+    view.bot_right = [t + (p - dt) * s for p, t, dt, s in zip(view.bot_right, box[0], drawn[0], scale)]
+
+def scale_hierarchy(hierarchy, size):
+    '''A copy of the drawing stretched to a root of size [height, width],
+    without any constraints.
+    '''
+    drawn = (hierarchy.top_left, hierarchy.bot_right)
+    box = (hierarchy.top_left, [t + s for t, s in zip(hierarchy.top_left, size)])
+    copy = hierarchy.deepcopy()
+    for view, depth in copy.iter_dfs():
+        stretch(view, box, drawn)
+    return copy
+
+def stack_solution(views):
+    '''The StackSolution a solved stack [root] + children carries.'''
+    root = views[0]
+    return StackSolution(root.alignment, root.spacing_constraint,
+                         [list(view.frame_constraint) for view in views[1:]],
+                         [view.padding_constraint[0] + view.padding_constraint[1] for view in views[1:]])
+
+def fit_paddings(views, solution, box):
+    '''Paddings for every child that lay the stack [root] + children out in
+    box, a (top_left, bot_right) root box, with the frames, spacing and
+    alignment of solution. As few of solution's paddings as possible change,
+    see the module docstring. None when no paddings fit.
+    '''
+    root = views[0]
+    n = len(views) - 1
+    major_axis = int(root.view_type)
+    minor_axis = (major_axis + 1) % 2
+    size = [b - t for t, b in zip(*box)]
+    frames = solution.frames
+    paddings = [list(padding) for padding in solution.paddings]
+
+    def shrink(slots, excess):
+        # Largest first, so the fewest paddings cover the excess
+        for i, j in sorted(slots, key=lambda slot: -paddings[slot[0]][slot[1]]):
+            if excess <= EPSILON:
+                break
+            cut = min(paddings[i][j], excess)
+            paddings[i][j] -= cut
+            excess -= cut
+        return excess <= EPSILON
+
+    unframed = any(frame[major_axis] == 0 for frame in frames)
+    taken = sum(frame[major_axis] for frame in frames) + solution.spacing * (n - 1) \
+            + sum(padding[2 * major_axis] + padding[2 * major_axis + 1] for padding in paddings)
+    if not shrink([(i, 2 * major_axis + k) for i in range(n) for k in range(2)],
+                  taken - size[major_axis] - (0 if unframed else 6)):
+        return None
+    for i in range(n):
+        across = paddings[i][2 * minor_axis] + frames[i][minor_axis] + paddings[i][2 * minor_axis + 1]
+        if not shrink([(i, 2 * minor_axis), (i, 2 * minor_axis + 1)], across - size[minor_axis]):
+            return None
+    return paddings
+
+class JointSolver(ConstraintSolver):
+    '''Solves the stack [root] + children for its drawn root and for every
+    (top_left, bot_right) root box in boxes as one z3 problem, see the module
+    docstring. After solve_z3 has found a solution, size_paddings holds the
+    paddings of every child for each box, otherwise it is None.
+    '''
+    def __init__(self, views, boxes, timeout=None):
+        super().__init__(views, closed_form=False, timeout=timeout)
+        self.boxes = boxes
+        self.size_paddings = None
+
+    def solve_z3(self):
+        # A session of its own, the model is read after optimize returns
+        session = SolverSession()
+        variables = session.variables(len(self.views) - 1)
+        session.optimize.set(timeout=self.z3_timeout())
+        solution = self.optimize(session.optimize, *variables)
+        session.solves += 1
+        if solution is None:
+            return None
+        m = session.optimize.model()
+        def get_long(realval):
+            return m[realval].numerator_as_long() / m[realval].denominator_as_long()
+        self.size_paddings = []
+        for pads in self.pads:
+            if pads is None:
+                self.size_paddings.append(solution.paddings)
+                continue
+            pre, post = pads
+            self.size_paddings.append([[get_long(pre[0][i]), get_long(post[0][i]),
+                                        get_long(pre[1][i]), get_long(post[1][i])]
+                                       for i in range(len(self.views) - 1)])
+        return solution
+
+    def extend(self, s, Spacing, Alignment, Frames, PrePad, PostPad):
+        from z3 import If, Q, Real, Sum
+        root = self.views[0]
+        n = len(self.views) - 1
+        major_axis = int(root.view_type)
+        minor_axis = (major_axis + 1) % 2
+        changes = []
+        # (PrePad, PostPad) of each box, None where it is the drawn root
+        self.pads = []
+        for k, (top_left, bot_right) in enumerate(self.boxes):
+            if list(top_left) == list(root.top_left) and list(bot_right) == list(root.bot_right):
+                self.pads.append(None)
+                continue
+            # Exact like the drawn geometry, so a stack that fills its root exactly still fits
+            size = [exact(b) - exact(t) for t, b in zip(top_left, bot_right)]
+            size = [Q(value.numerator, value.denominator, Spacing.ctx) for value in size]
+            pre = [[Real(f'Pre{k}_{axis}_{i}', Spacing.ctx) for i in range(n)] for axis in range(2)]
+            post = [[Real(f'Post{k}_{axis}_{i}', Spacing.ctx) for i in range(n)] for axis in range(2)]
+            self.pads.append((pre, post))
+            for axis in range(2):
+                for i in range(n):
+                    s.add(pre[axis][i] >= 0, post[axis][i] >= 0)
+                    changes.append(If(pre[axis][i] == PrePad[axis][i], 0, 1))
+                    changes.append(If(post[axis][i] == PostPad[axis][i], 0, 1))
+            unframed = Sum([If(frame == 0, 1, 0) for frame in Frames[major_axis]])
+            taken = Sum(Frames[major_axis]) + Sum(pre[major_axis]) + Sum(post[major_axis]) + Spacing * (n - 1)
+            s.add(taken <= size[major_axis] + If(unframed == 0, 6, 0))
+            for i in range(n):
+                s.add(pre[minor_axis][i] + Frames[minor_axis][i] + post[minor_axis][i] <= size[minor_axis])
+        if len(changes) > 0:
+            s.minimize(Sum(changes))
+
+class SizedLayout:
+    '''One size of solve_sizes: the hierarchy laid out at that size with its
+    constraints, the worst SolveStatus of its stacks and how many stacks
+    were solved for this size on its own because no shared frames and
+    spacing fit it.
+    '''
+    def __init__(self, size, hierarchy, status, separate):
+        self.size = size
+        self.hierarchy = hierarchy
+        self.status = status
+        self.separate = separate
+
+    def to_swiftui(self, indent=''):
+        return self.hierarchy.to_swiftui(indent)
+
+def solve_sizes(hierarchy, sizes, cache=None, timeout=None, budget=None, processes=None):
+    '''Solves the hierarchy in place at its drawn size and lays it out at
+    every [height, width] in sizes, returning a SizedLayout for each. cache,
+    timeout, budget and processes are passed on to Hierarchy.solve for the
+    drawn size. timeout also limits every JointSolver and separate solve.
+    '''
+    status = hierarchy.solve(processes=processes, cache=cache, timeout=timeout, budget=budget)
+    copies = []
+    for size in sizes:
+        copy = hierarchy.deepcopy()
+        copy.bot_right = [t + s for t, s in zip(copy.top_left, size)]
+        copies.append(copy)
+    statuses = [status] * len(sizes)
+    separate = [0] * len(sizes)
+    sized_stacks = [copy.stacks() for copy in copies]
+    for j, stack in enumerate(hierarchy.stacks()):
+        views = [stack] + stack.children
+        if len(views) == 1:
+            continue
+        sized = [[stacks[j]] + stacks[j].children for stacks in sized_stacks]
+        boxes = [(size_views[0].top_left, size_views[0].bot_right) for size_views in sized]
+        solution = stack_solution(views)
+        paddings = [fit_paddings(views, solution, box) for box in boxes]
+        if None in paddings:
+            solver = JointSolver(views, boxes, timeout)
+            joint = solver.solve_z3()
+            if joint is not None:
+                joint.apply(views)
+                solution = joint
+                paddings = solver.size_paddings
+                statuses = [max(size_status, joint.status) for size_status in statuses]
+        for k, size_views in enumerate(sized):
+            if paddings[k] is None:
+                # Nothing shared fits, lay the drawing out at this size alone
+                for view, drawn in zip(size_views[1:], views[1:]):
+                    view.top_left, view.bot_right = list(drawn.top_left), list(drawn.bot_right)
+                    stretch(view, boxes[k], (stack.top_left, stack.bot_right))
+                size_status = ConstraintSolver(size_views, cache=cache, timeout=timeout).solve().status
+                statuses[k] = max(statuses[k], size_status)
+                separate[k] += 1
+                continue
+            StackSolution(solution.alignment, solution.spacing, solution.frames, paddings[k]).apply(size_views)
+            # Where the constraints put the children at this size
+            coords = verify_stack(size_views).coords
+            for view, box in zip(size_views[1:], coords[1:].tolist()):
+                view.top_left, view.bot_right = box
+    return [SizedLayout(list(size), copy, size_status, count)
+            for size, copy, size_status, count in zip(sizes, copies, statuses, separate)]
+
+def constraint_values(hierarchy):
+    '''Yields (index, name, value) for every constraint in the hierarchy,
+    where index numbers the views in iter_dfs order.
+    '''
+    for i, (view, depth) in enumerate(hierarchy.iter_dfs()):
+        if isinstance(view, Hierarchy):
+            yield i, 'alignment', view.alignment
+            yield i, 'spacing', view.spacing_constraint
+        if i == 0:
+            continue
+        frame = view.frame_constraint or [None, None]
+        yield i, 'frame height', frame[0]
+        yield i, 'frame width', frame[1]
+        for names, padding in zip([('padding top', 'padding bottom'), ('padding leading', 'padding trailing')],
+                                  view.padding_constraint):
+            for name, value in zip(names, padding):
+                yield i, name, value
+
+def size_report(layouts):
+    '''The constraints that differ between the layouts of solve_sizes, at the
+    0.1 points SwiftUI is written with. One dict per constraint with the
+    value at each size, in the order of layouts.
+    '''
+    report = []
+    tables = [list(constraint_values(layout.hierarchy)) for layout in layouts]
+    for entries in zip(*tables):
+        view, name, value = entries[0]
+        values = [None if value is None else round(value, 1) for view, name, value in entries]
+        if len(set(values)) > 1:
+            report.append({'view': view, 'constraint': name, 'values': values})
+    return report
+
+def parse_size(text):
+    '''Reads width x height, e.g. 375x667, into [height, width].'''
+    width, height = text.lower().split('x')
+    return [float(height), float(width)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sketch', help='JSON list of views, - for stdin')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', required=True, help='width x height, e.g. 375x667')
+    parser.add_argument('--no-cleanse', dest='cleanse', action='store_false',
+                        help='solve the sketch exactly as drawn')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per stack')
+    parser.add_argument('-o', '--output', default='-', help='JSON output file, - for stdout')
+    args = parser.parse_args(argv)
+    f = sys.stdin if args.sketch == '-' else open(args.sketch)
+    sketch = json.load(f)
+    if f is not sys.stdin:
+        f.close()
+    if isinstance(sketch, dict):
+        sketch = sketch['views']
+    hierarchy = infer_hierarchy([View.from_dict(view) for view in sketch])
+    if args.cleanse:
+        hierarchy.cleanse()
+    layouts = solve_sizes(hierarchy, args.sizes, timeout=args.timeout)
+    # Rounds the constraints, so the report is taken first
+    report = size_report(layouts)
+    result = {'layouts': [{'width': layout.size[1], 'height': layout.size[0],
+                           'status': layout.status.name, 'separate': layout.separate,
+                           'swiftui': layout.to_swiftui()} for layout in layouts],
+              'report': report}
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    json.dump(result, out, indent=2)
+    out.write('\n')
+    if out is not sys.stdout:
+        out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''Synthetic sketches for benchmarks: random but plausible view lists in the
+same format the Canvas produces, root first.
+'''
+from view import *
+import random
+
+def stack_views(n, seed=0, unframed_every=3):
+    '''A single HStack of n children drawn from a few size classes, with every
+    `unframed_every`th child unframed.
+    '''
+    rng = random.Random(seed)
+    sizes = [[40, 40], [60, 40], [40, 80]]
+    gap = 10
+    root = View([0, 0], [0, 0], view_type=ViewType.HStack)
+    views = [root]
+    x = gap
+    height = max(size[0] for size in sizes) + 2 * gap
+    for i in range(n):
+        size = rng.choice(sizes)
+        top = (height - size[0]) / 2
+        mode = ViewMode.Unframed if unframed_every and i % unframed_every == unframed_every - 1 else ViewMode.Framed
+        views.append(View([top, x], [top + size[0], x + size[1]], view_mode=mode))
+        x += size[1] + gap
+    root.bot_right = [height, x]
+    return views
+
+def random_sketch(children=4, depth=2, framed_ratio=0.7, jitter=2.0, nesting=0.5,
+                  size=(667, 375), seed=0):
+    '''Recursively splits the screen into rows and columns of up to `children`
+    slots, nesting another level in a slot with probability `nesting` until
+    `depth` levels deep. Each slot that is not split becomes a leaf that is
+    framed with probability `framed_ratio`, shrunk across the stack and
+    lined up leading, centered or trailing. Every leaf coordinate is then
+    moved by up to `jitter` points, like a hand drawn rectangle. Gaps are kept
+    wide enough that the jitter never makes views overlap.
+    '''
+    rng = random.Random(seed)
+    views = [View([0, 0], list(size))]
+    gap = max(8, 4 * jitter + 2)
+
+    def fill(top_left, bot_right, axis, level):
+        minor = (axis + 1) % 2
+        count = rng.randint(2, max(2, children))
+        weights = [rng.choice([1, 1, 2]) for i in range(count)]
+        extent = bot_right[axis] - top_left[axis] - gap * (count + 1)
+        if extent / sum(weights) < gap:
+            return leaf(top_left, bot_right, axis)
+        start = top_left[axis] + gap
+        for weight in weights:
+            slot_top_left, slot_bot_right = list(top_left), list(bot_right)
+            slot_top_left[axis] = start
+            slot_bot_right[axis] = start + extent * weight / sum(weights)
+            slot_top_left[minor] += gap
+            slot_bot_right[minor] -= gap
+            start = slot_bot_right[axis] + gap
+            if level < depth and rng.random() < nesting:
+                fill(slot_top_left, slot_bot_right, minor, level + 1)
+            else:
+                leaf(slot_top_left, slot_bot_right, axis)
+
+    def leaf(top_left, bot_right, axis):
+        minor = (axis + 1) % 2
+        top_left, bot_right = list(top_left), list(bot_right)
+        room = bot_right[minor] - top_left[minor]
+        shrink = room * (1 - rng.uniform(0.4, 1))
+        top_left[minor] += shrink * rng.choice([0, 0.5, 1])
+        bot_right[minor] = top_left[minor] + room - shrink
+        mode = ViewMode.Framed if rng.random() < framed_ratio else ViewMode.Unframed
+        top_left = [p + rng.uniform(-jitter, jitter) for p in top_left]
+        bot_right = [p + rng.uniform(-jitter, jitter) for p in bot_right]
+        views.append(View(top_left, bot_right, view_mode=mode))
+
+    fill([0, 0], list(size), rng.randint(0, 1), 1)
+    return views
@@ -0,0 +1,76 @@
+from view import *
+from constraint_solver import StackSolution, exact
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+class SolveCache:
+    '''Content-addressed cache of StackSolutions. A stack's solution only
+    depends on its geometry relative to its own top left corner, so stacks that
+    are moved around or repeated across screens share one entry.
+
+    The in-memory tier keeps the most recently used `size` entries. If `path`
+    is given, solutions are also written there as one JSON file per key and
+    read back on a memory miss.
+    '''
+    def __init__(self, size=1024, path=None):
+        self.size = size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(views):
+        root = views[0]
+        def rel(point):
+            # Differences of the coordinates as z3 reads them, rounded off
+            # below anything drawable, so the rounding of a translation never
+            # changes the key
+            return [str(round(exact(p) - exact(o), 6)) for p, o in zip(point, root.top_left)]
+        geometry = [int(root.view_type), rel(root.bot_right)]
+        for view in views[1:]:
+            geometry.append([rel(view.top_left), rel(view.bot_right), bool(view.view_mode)])
+        return hashlib.sha1(json.dumps(geometry).encode()).hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, views):
+        key = self.key(views)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return StackSolution.from_dict(json.loads(self.entries[key]))
+        if self.path is not None and os.path.exists(self.file(key)):
+            with open(self.file(key)) as f:
+                entry = f.read()
+            self.remember(key, entry)
+            self.hits += 1
+            return StackSolution.from_dict(json.loads(entry))
+        self.misses += 1
+        return None
+
+    def put(self, views, solution):
+        key = self.key(views)
+        # Entries are kept serialized so callers can't mutate cached values
+        entry = json.dumps(solution.to_dict())
+        self.remember(key, entry)
+        if self.path is not None:
+            # Write then rename so a concurrent reader never sees half a file
+            tmp = self.file(key) + '.' + str(os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(entry)
+            os.replace(tmp, self.file(key))
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
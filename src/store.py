@@ -0,0 +1,118 @@
+'''Columnar storage for large layouts.
+
+NumPy is needed here and in the modules built on these arrays, verify.py
+and vectorized_cleanse.py, as well as in milp.py. sizes.py and bench.py
+import verify.py. Inference, cleanse, solving with z3 and the SwiftUI
+output run without it: ConstraintSolver.verify, Hierarchy.verify and
+cleanse(vectorized=True) only import it when they are called.
+'''
+from view import *
+from hierarchy import *
+import numpy as np
+
+def preorder(hierarchy):
+    '''Every view of hierarchy in ViewStore id order, and the id of each
+    one's parent, -1 for the root.
+    '''
+    order = []
+    parents = []
+    # path[d] is the id of the stack the walk is in at depth d
+    path = []
+    for view, depth in hierarchy.iter_dfs():
+        del path[depth:]
+        parents.append(path[-1] if path else -1)
+        path.append(len(order))
+        order.append(view)
+    return order, parents
+
+class ViewStore:
+    '''Coordinates and constraints of a whole hierarchy in NumPy arrays indexed
+    by view id. Ids follow a depth first walk with parents before children,
+    so the subtree of view i is the id range [i, end[i]) and moving,
+    copying or listing the leaves of any part of the tree is one array
+    operation instead of a walk over View objects.
+
+    coords[i] is [top_left, bot_right]. A frame of 0 means no frame on that
+    axis, which is how View.is_framed reads it too.
+    '''
+    def __init__(self, n):
+        self.coords = np.zeros((n, 2, 2))
+        self.view_type = np.full(n, int(ViewType.Leaf), dtype=np.int8)
+        self.view_mode = np.ones(n, dtype=bool)
+        self.parent = np.full(n, -1, dtype=np.int32)
+        self.end = np.arange(1, n + 1, dtype=np.int32)
+        self.spacing = np.zeros(n)
+        self.alignment = np.ones(n, dtype=np.int8)
+        self.padding = np.zeros((n, 2, 2))
+        self.frame = np.zeros((n, 2))
+
+    def __len__(self):
+        return len(self.coords)
+
+    @staticmethod
+    def from_hierarchy(hierarchy):
+        return ViewStore.from_preorder(*preorder(hierarchy))
+
+    @staticmethod
+    def from_preorder(order, parents):
+        '''Builds a store from the output of preorder, one column at a time.'''
+        store = ViewStore(0)
+        store.coords = np.array([[view.top_left, view.bot_right] for view in order], dtype=float).reshape(-1, 2, 2)
+        store.view_type = np.array([int(view.view_type) for view in order], dtype=np.int8)
+        store.view_mode = np.array([bool(view.view_mode) for view in order], dtype=bool)
+        store.parent = np.array(parents, dtype=np.int32)
+        store.end = np.arange(1, len(order) + 1, dtype=np.int32)
+        store.spacing = np.array([view.spacing_constraint for view in order], dtype=float)
+        store.alignment = np.array([view.alignment for view in order], dtype=np.int8)
+        store.padding = np.array([view.padding_constraint for view in order], dtype=float).reshape(-1, 2, 2)
+        store.frame = np.array([[0, 0] if view.frame_constraint is None else
+                                [0 if f is None else f for f in view.frame_constraint] for view in order],
+                               dtype=float).reshape(-1, 2)
+        # Children come after their parent, so one backwards pass sizes every subtree
+        for i in range(len(order) - 1, 0, -1):
+            store.end[parents[i]] = max(store.end[parents[i]], store.end[i])
+        return store
+
+    def to_hierarchy(self):
+        '''Builds View and Hierarchy objects for the whole store.'''
+        views = []
+        for i in range(len(self)):
+            top_left, bot_right = self.coords[i].tolist()
+            if self.view_type[i] == ViewType.Leaf:
+                view = View(top_left, bot_right, view_mode=ViewMode(bool(self.view_mode[i])))
+            else:
+                view = Hierarchy(top_left, bot_right, ViewType(int(self.view_type[i])), children=[])
+            view.spacing_constraint = float(self.spacing[i])
+            view.alignment = int(self.alignment[i])
+            view.padding_constraint = self.padding[i].tolist()
+            if self.frame[i].any():
+                view.frame_constraint = self.frame[i].tolist()
+            views.append(view)
+            if self.parent[i] >= 0:
+                views[self.parent[i]].children.append(view)
+        return views[0]
+
+    def copy(self):
+        store = ViewStore(0)
+        for name, array in vars(self).items():
+            setattr(store, name, array.copy())
+        return store
+
+    def subtree(self, i):
+        return slice(i, self.end[i])
+
+    def move(self, i, diff):
+        '''Moves view i and everything inside it by diff = [dy, dx].'''
+        self.coords[self.subtree(i)] += np.asarray(diff, dtype=float)
+
+    def leaves(self, i=0):
+        '''Ids of the leaves under view i, in the order of Hierarchy.flatlist.'''
+        ids = np.arange(i, self.end[i])
+        return ids[self.view_type[ids] == ViewType.Leaf]
+
+    def children(self, i):
+        return np.flatnonzero(self.parent == i)
+
+    def size(self, axis):
+        '''Sizes of every view along axis.'''
+        return self.coords[:, 1, axis] - self.coords[:, 0, axis]
@@ -1,6 +1,19 @@
 import unittest
 from constraint_solver import *
 from hierarchy import *
+from solve_cache import *
+from incremental import *
+from profiler import *
+from sketches import *
+from store import *
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
 
 class TestHierarchyInference(unittest.TestCase):
     def test_hierarchy_inference_simple(self):
@@ -22,6 +35,57 @@ class TestHierarchyInference(unittest.TestCase):
         self.assertTrue(child1 in hierarchy.children[0].children)
         self.assertTrue(child2 in hierarchy.children[0].children)
 
+    def test_hierarchy_inference_grid_tie(self):
+        root = View([0, 0], [100, 100])
+        cells = [View([10, 10], [40, 40]), View([10, 60], [40, 90]),
+                 View([60, 10], [90, 40]), View([60, 60], [90, 90])]
+        hierarchy = infer_hierarchy([root] + cells)
+        self.assertEqual(hierarchy.view_type, ViewType.VStack)
+        self.assertListEqual(hierarchy.children[0].children, cells[:2])
+        self.assertListEqual(hierarchy.children[1].children, cells[2:])
+
+    def test_divide_views_single_row(self):
+        views = [View([0, 10 * i], [10, 10 * i + 5]) for i in range(50)]
+        hierarchy, complexity = divide_views(list(reversed(views)), 1)
+        self.assertEqual(complexity, 1)
+        self.assertListEqual(hierarchy.children, views)
+
+    def test_search_matches_both_axes(self):
+        for seed in range(10):
+            views = random_sketch(children=5, depth=4, seed=seed)[1:]
+            vert = divide_views(views, 0)[1]
+            hori = divide_views(views, 1)[1]
+            search = HierarchySearch(views)
+            hierarchy, complexity = search.search(list(range(len(views))))
+            self.assertEqual(complexity, min(vert, hori))
+            self.assertEqual(len(hierarchy.flatlist()), len(views))
+
+    def test_overlapping_views(self):
+        root = View([0, 0], [100, 100])
+        row = [View([10, 10], [40, 40]), View([10, 50], [40, 90])]
+        below = View([38, 10], [90, 90])
+        for overlap in [0, 4]:
+            hierarchy = infer_hierarchy([root] + row + [below], overlap=overlap)
+            self.assertEqual(hierarchy.view_type, ViewType.VStack)
+            self.assertListEqual(hierarchy.children[0].children, row)
+            self.assertEqual(hierarchy.children[1], below)
+
+    def test_overlap_tolerance_simplifies(self):
+        root = View([0, 0], [100, 100])
+        # Two columns that overlap by a point, next to a tall view
+        columns = [View([0, 0], [40, 30]), View([60, 0], [100, 30]), View([0, 29], [40, 60]),
+                   View([50, 29], [100, 60])]
+        tall = View([0, 70], [100, 90])
+        views = columns + [tall]
+        strict = HierarchySearch(views).search(list(range(5)))[1]
+        tolerant = HierarchySearch(views, (0, 2)).search(list(range(5)))[1]
+        self.assertEqual((strict, tolerant), (4, 3))
+        hierarchy = infer_hierarchy([root] + views, overlap=2)
+        self.assertEqual(hierarchy.view_type, ViewType.HStack)
+        self.assertListEqual(hierarchy.children[0].children, columns[:2])
+        self.assertListEqual(hierarchy.children[1].children, columns[2:])
+        self.assertEqual(hierarchy.children[2], tall)
+
 class TestSolver(unittest.TestCase):
     def test_two_view_vstack(self):
         pass
@@ -79,6 +143,464 @@ class TestSolver(unittest.TestCase):
         # views_output = ConstraintSolver(view_list)
         # views_output.solve()
 
+    def test_fractional_coordinates(self):
+        # 0.3 - 0.1 rounds to 0.19999999999999998 in floating point
+        root = View([0, 0], [1, 1], view_type=ViewType.VStack)
+        view_list = [root, View([0.1, 0.1], [0.3, 0.7])]
+        solution = ConstraintSolver(view_list, closed_form=False).solve()
+        self.assertEqual(solution.status, SolveStatus.Optimal)
+        self.assertEqual(solution.frames, [[0.2, 0.6]])
+        self.assertEqual(ConstraintSolver(view_list).solve_closed_form().frames, solution.frames)
+
+    def test_matching_pairs(self):
+        from z3 import BoolVal, main_ctx, simplify
+        # Classes taken by 3, 2 and 1 children, and one taken by none of its 2
+        taken, never = BoolVal(True), BoolVal(False)
+        classes = {'a': [taken] * 3, 'b': [taken] * 2, 'c': [taken], 'd': [never] * 2}
+        self.assertEqual(simplify(matching_pairs(classes, main_ctx())).as_long(), 3 + 1)
+
+    def test_cleansed_sketches_solve(self):
+        for seed in range(2):
+            hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, seed=seed))
+            hierarchy.cleanse()
+            self.assertEqual(hierarchy.solve(), SolveStatus.Optimal)
+            self.assertTrue(hierarchy.verify().ok)
+
+class TestClosedForm(unittest.TestCase):
+    def assertMatchesZ3(self, view_list):
+        closed = ConstraintSolver(view_list).solve_closed_form()
+        self.assertIsNotNone(closed)
+        z3 = ConstraintSolver(view_list, closed_form=False).solve()
+        self.assertEqual(closed.alignment, z3.alignment)
+        self.assertEqual(closed.spacing, z3.spacing)
+        self.assertEqual(closed.frames, z3.frames)
+        self.assertEqual(closed.paddings, z3.paddings)
+
+    def test_single_framed(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        child1 = View([10, 20], [40, 70])
+        self.assertMatchesZ3([root, child1])
+
+    def test_single_unframed(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.HStack)
+        child1 = View([10, 20], [40, 70], view_mode=ViewMode.Unframed)
+        self.assertMatchesZ3([root, child1])
+
+    def test_evenly_spaced(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        child1 = View([10, 10], [30, 40])
+        child2 = View([40, 20], [60, 50])
+        child3 = View([70, 10], [90, 30])
+        self.assertMatchesZ3([root, child1, child2, child3])
+
+    def test_uneven_falls_back(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        child1 = View([10, 10], [30, 40])
+        child2 = View([35, 20], [60, 50])
+        self.assertIsNone(ConstraintSolver([root, child1, child2]).solve_closed_form())
+
+def objectives(solution, views):
+    '''The objectives of ConstraintSolver.optimize in order. Ties may break
+    differently between ways of solving, so compare these instead.
+    '''
+    unframed = sum(frame.count(0) for frame, view in zip(solution.frames, views[1:])
+                   if view.view_mode == ViewMode.Unframed)
+    frames = [tuple(frame) for frame in solution.frames]
+    matching = sum(frames[i] == frames[j] for i in range(len(frames)) for j in range(i + 1, len(frames)))
+    symmetric = sum([p[0] == p[1] for p in solution.paddings] + [p[2] == p[3] for p in solution.paddings])
+    return unframed, matching, symmetric, solution.alignment == 1, solution.spacing
+
+class ObjectivesTestCase(unittest.TestCase):
+    # (children, seed) of the stack_views every other way of solving is checked on
+    STACKS = [(1, 0), (2, 1), (6, 2), (9, 3)]
+
+    def assertSameObjectives(self, views, method, **solver_args):
+        '''Solves views with solver_args and checks that method solved them,
+        that the layout verifies and that it reaches the objectives of solving
+        the whole stack with z3. Returns the solution.
+        '''
+        whole = ConstraintSolver([View.deepcopy(view) for view in views], closed_form=False).solve()
+        solver = ConstraintSolver(views, closed_form=False, **solver_args)
+        solution = solver.solve()
+        self.assertEqual(solution.stats['method'], method)
+        self.assertTrue(solver.verify())
+        self.assertEqual(objectives(solution, views)[:-1], objectives(whole, views)[:-1])
+        self.assertAlmostEqual(solution.spacing, whole.spacing)
+        return solution
+
+    def assertSameObjectivesOnStacks(self, method, **solver_args):
+        for n, seed in self.STACKS:
+            self.assertSameObjectives(stack_views(n, seed=seed), method, **solver_args)
+
+class TestDecompose(ObjectivesTestCase):
+    def test_matches_whole(self):
+        self.assertSameObjectivesOnStacks('decomposed', decompose=True)
+
+    def test_hstack(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.HStack)
+        views = [root, View([20, 10], [80, 30]), View([10, 40], [90, 55], view_mode=ViewMode.Unframed),
+                 View([30, 70], [70, 90])]
+        self.assertSameObjectives(views, 'decomposed', decompose=True)
+
+    def test_fractional_coordinates(self):
+        root = View([0, 0], [1, 1], view_type=ViewType.VStack)
+        views = [root, View([0.1, 0.1], [0.3, 0.7]), View([0.4, 0.1], [0.7, 0.9], view_mode=ViewMode.Unframed),
+                 View([0.8, 0.3], [0.9, 0.7])]
+        decomposed = self.assertSameObjectives(views, 'decomposed', decompose=True)
+        self.assertEqual(decomposed.status, SolveStatus.Optimal)
+        self.assertEqual(decomposed.frames[0], [0.2, 0.6])
+
+    def test_coupled_axes_solve_whole(self):
+        # Sticks out of the stack, so it needs a minor frame to be centered
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        views = [root, View([10, -5], [40, 50], view_mode=ViewMode.Unframed), View([50, 20], [90, 80])]
+        solver = ConstraintSolver([View.deepcopy(view) for view in views], closed_form=False, decompose=True)
+        self.assertIsNone(solver.solve_decomposed())
+        self.assertSameObjectives(views, 'z3', decompose=True)
+
+    def test_parts_share_the_timeout(self):
+        class SlowDecompose(ConstraintSolver):
+            def solve_decomposed(self):
+                time.sleep(self.time_left())
+                return None
+        solution = SlowDecompose(stack_views(4), closed_form=False, timeout=0.05, decompose=True).solve()
+        self.assertEqual(solution.stats['method'], 'fallback')
+
+@unittest.skipUnless(importlib.util.find_spec('scipy'), 'the MILP backend needs SciPy')
+class TestMILPBackend(ObjectivesTestCase):
+    def test_matches_z3(self):
+        from milp import MILPBackend
+        self.assertSameObjectivesOnStacks('milp', backend=MILPBackend())
+
+    def test_random_sketches(self):
+        from milp import MILPBackend
+        from verify import verify_stack
+        # Float noise: the MILP holds equalities to a tolerance, z3 exactly
+        def tolerant(solution, views):
+            unframed, matching, symmetric, centered, spacing = objectives(solution, views)
+            symmetric = sum([abs(p[0] - p[1]) <= 1e-6 for p in solution.paddings] +
+                            [abs(p[2] - p[3]) <= 1e-6 for p in solution.paddings])
+            return unframed, matching, symmetric, centered, round(spacing, 5)
+        for seed in range(4):
+            hierarchy = infer_hierarchy(random_sketch(children=4, depth=2, seed=seed))
+            hierarchy.cleanse()
+            for stack in hierarchy.stacks():
+                views = [View.deepcopy(view) for view in [stack] + stack.children]
+                whole = ConstraintSolver(views, closed_form=False).solve()
+                milp = ConstraintSolver(views, closed_form=False, backend=MILPBackend()).solve()
+                if milp.status == SolveStatus.Fallback:
+                    self.assertEqual(whole.status, SolveStatus.Fallback)
+                    continue
+                self.assertLess(verify_stack(views).worst, 1e-5)
+                self.assertGreaterEqual(tolerant(milp, views), tolerant(whole, views))
+
+    def test_fractional_coordinates(self):
+        from milp import MILPBackend
+        root = View([0, 0], [1, 1], view_type=ViewType.VStack)
+        # 0.3 - 0.1 and 0.7 - 0.5 round to different floats
+        views = [root, View([0.1, 0.1], [0.3, 0.7]), View([0.5, 0.1], [0.7, 0.7])]
+        milp = self.assertSameObjectives(views, 'milp', backend=MILPBackend())
+        self.assertEqual(milp.frames, [[0.2, 0.6], [0.2, 0.6]])
+
+    def test_hierarchy(self):
+        from milp import MILPBackend
+        hierarchy = infer_hierarchy(random_sketch(children=3, depth=2, seed=1))
+        hierarchy.cleanse()
+        profiler = SolveProfiler()
+        self.assertEqual(hierarchy.solve(backend=MILPBackend(), profiler=profiler), SolveStatus.Optimal)
+        self.assertTrue(hierarchy.verify().ok)
+        self.assertIn('milp', [record['method'] for record in profiler.records])
+
+    def test_infeasible_falls_back(self):
+        from milp import MILPBackend
+        # Overlapping children leave no room for padding and spacing
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        views = [root, View([10, 10], [50, 90]), View([40, 10], [60, 90])]
+        solution = ConstraintSolver(views, closed_form=False, backend=MILPBackend()).solve()
+        self.assertEqual(solution.status, SolveStatus.Fallback)
+
+class TestTimeouts(unittest.TestCase):
+    def test_fallback_reproduces_geometry(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        child1 = View([10, 10], [30, 40])
+        child2 = View([35, 20], [60, 50], view_mode=ViewMode.Unframed)
+        view_list = [root, child1, child2]
+        solution = ConstraintSolver(view_list, timeout=0).solve()
+        self.assertEqual(solution.status, SolveStatus.Fallback)
+        self.assertListEqual(view_list, ConstraintSolver(view_list).constraint_to_coords())
+
+    def test_hierarchy_budget(self):
+        # Unevenly spaced, so the closed form does not apply
+        root = View([0, 0], [100, 100])
+        child1 = View([10, 10], [40, 30])
+        child2 = View([10, 35], [40, 60])
+        child3 = View([10, 80], [40, 90])
+        hierarchy = infer_hierarchy([root, child1, child2, child3])
+        self.assertEqual(hierarchy.solve(budget=0), SolveStatus.Fallback)
+        hierarchy = infer_hierarchy([root, child1, child2, child3])
+        self.assertEqual(hierarchy.solve(timeout=10), SolveStatus.Optimal)
+
+class TestProfiler(unittest.TestCase):
+    def test_records_every_stack(self):
+        root = View([0, 0], [100, 100])
+        child1 = View([10, 10], [40, 30])
+        child2 = View([10, 35], [40, 60])
+        child3 = View([10, 70], [40, 80])
+        child4 = View([60, 10], [90, 90])
+        hierarchy = infer_hierarchy([root, child1, child2, child3, child4])
+        seen = []
+        profiler = SolveProfiler(callback=seen.append)
+        hierarchy.solve(profiler=profiler)
+        self.assertEqual(len(profiler.records), len(hierarchy.stacks()))
+        self.assertEqual(seen, profiler.records)
+        self.assertEqual([record['depth'] for record in profiler.records], [0, 1])
+        solved = [record for record in profiler.records if record['method'] == 'z3']
+        self.assertTrue(solved)
+        self.assertIn('conflicts', solved[0]['z3'])
+        self.assertGreater(solved[0]['objectives'], 0)
+        report = json.loads(profiler.to_json())['report']
+        self.assertEqual(report['stacks'], 2)
+
+class TestSolverSession(unittest.TestCase):
+    def stack(self, mode):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        child1 = View([10, 10], [30, 90], view_mode=mode)
+        child2 = View([40, 10], [60, 90], view_mode=mode)
+        return [root, child1, child2]
+
+    def test_scopes_do_not_leak(self):
+        session = SolverSession()
+        unframed = ConstraintSolver(self.stack(ViewMode.Unframed), closed_form=False, session=session).solve()
+        framed = ConstraintSolver(self.stack(ViewMode.Framed), closed_form=False, session=session).solve()
+        self.assertEqual(unframed.frames, [[0, 0], [0, 0]])
+        self.assertEqual(framed.frames, [[20, 80], [20, 80]])
+        self.assertEqual(framed.spacing, 10)
+        self.assertEqual(session.solves, 2)
+
+class TestSolveCache(unittest.TestCase):
+    def stack(self, offset=0):
+        root = View([offset, 0], [offset + 100, 100], view_type=ViewType.VStack)
+        child1 = View([offset + 10, 10], [offset + 30, 40])
+        child2 = View([offset + 35, 20], [offset + 60, 50], view_mode=ViewMode.Unframed)
+        return [root, child1, child2]
+
+    def test_hit_after_move(self):
+        cache = SolveCache()
+        fresh = ConstraintSolver(self.stack(), cache=cache).solve()
+        moved = self.stack(offset=3.3)
+        cached = ConstraintSolver(moved, cache=cache).solve()
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(fresh.to_dict(), cached.to_dict())
+        self.assertEqual(moved[1].frame_constraint, fresh.frames[0])
+
+    def test_hit_after_moving_sketch(self):
+        cache = SolveCache()
+        hierarchy = infer_hierarchy(random_sketch(seed=1))
+        hierarchy.cleanse()
+        hierarchy.solve(cache=cache)
+        misses = cache.misses
+        hierarchy.move([3.3, 1.7])
+        hierarchy.solve(cache=cache)
+        self.assertEqual(cache.misses, misses)
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as path:
+            fresh = ConstraintSolver(self.stack(), cache=SolveCache(path=path)).solve()
+            cache = SolveCache(path=path)
+            self.assertEqual(cache.get(self.stack()).to_dict(), fresh.to_dict())
+
+    def test_lru_eviction(self):
+        cache = SolveCache(size=1)
+        ConstraintSolver(self.stack(), cache=cache).solve()
+        other = self.stack()
+        other[2].view_mode = ViewMode.Framed
+        ConstraintSolver(other, cache=cache).solve()
+        self.assertIsNone(cache.get(self.stack()))
+        self.assertIsNotNone(cache.get(other))
+
+class TestIncrementalSolver(unittest.TestCase):
+    def views(self, shift=0):
+        return [View([0, 0], [100, 100]),
+                View([10, 10], [40, 40]), View([10, 60], [40, 90]),
+                View([60, 10], [90, 40]), View([60, 60 + shift], [90, 85 + shift])]
+
+    def test_only_changed_stacks_resolve(self):
+        solver = IncrementalSolver()
+        solver.submit(self.views())
+        stacks = len(solver.hierarchy.stacks())
+        self.assertEqual(solver.cache.misses, stacks)
+        edited = self.views(shift=5)
+        swiftui = solver.submit(edited)
+        # The untouched row is answered from the cache
+        self.assertEqual(solver.cache.hits, 1)
+        self.assertEqual(solver.cache.misses, 2 * stacks - 1)
+        fresh = infer_hierarchy(self.views(shift=5))
+        fresh.solve()
+        self.assertEqual(swiftui, fresh.to_swiftui())
+        self.assertEqual(len(edited), 5)
+
+class TestParallelSolve(unittest.TestCase):
+    def constraints(self, hierarchy):
+        nodes = hierarchy.stacks() + hierarchy.flatlist()
+        return [(view.alignment, view.spacing_constraint, view.frame_constraint, view.padding_constraint)
+                for view in nodes]
+
+    def test_parallel_matches_serial(self):
+        root = View([0, 0], [100, 100])
+        child1 = View([10, 10], [40, 40])
+        child2 = View([10, 60], [40, 90], view_mode=ViewMode.Unframed)
+        child3 = View([60, 10], [90, 40])
+        child4 = View([60, 60], [90, 90])
+        serial = infer_hierarchy([root, child1, child2, child3, child4])
+        parallel = serial.deepcopy()
+        serial.solve()
+        parallel.solve(processes=2)
+        self.assertEqual(self.constraints(serial), self.constraints(parallel))
+
+class TestViewStore(unittest.TestCase):
+    def hierarchy(self):
+        return infer_hierarchy(random_sketch(children=4, depth=3, seed=3))
+
+    def test_round_trip(self):
+        hierarchy = self.hierarchy()
+        hierarchy.solve()
+        store = ViewStore.from_hierarchy(hierarchy)
+        self.assertEqual(store.to_hierarchy().to_swiftui(), hierarchy.to_swiftui())
+
+    def test_bulk_operations(self):
+        hierarchy = self.hierarchy()
+        store = ViewStore.from_hierarchy(hierarchy)
+        copy = store.copy()
+        leaves = hierarchy.flatlist()
+        self.assertEqual([store.coords[i].tolist() for i in store.leaves()],
+                         [[view.top_left, view.bot_right] for view in leaves])
+        sub = hierarchy.children[0]
+        i = store.children(0)[0]
+        sub.move([5, -3])
+        store.move(i, [5, -3])
+        np.testing.assert_allclose(ViewStore.from_hierarchy(hierarchy).coords, store.coords)
+        self.assertFalse(np.array_equal(copy.coords, store.coords))
+
+class TestVectorizedCleanse(unittest.TestCase):
+    def test_matches_default_engine(self):
+        for seed in range(20):
+            default = infer_hierarchy(random_sketch(children=5, depth=3, jitter=4, seed=seed))
+            vectorized = infer_hierarchy(random_sketch(children=5, depth=3, jitter=4, seed=seed))
+            default.cleanse()
+            vectorized.cleanse(vectorized=True)
+            for a, b in zip(default.flatlist(), vectorized.flatlist()):
+                for p, q in zip(a.top_left + a.bot_right, b.top_left + b.bot_right):
+                    self.assertAlmostEqual(p, q, places=9)
+
+class TestVerify(unittest.TestCase):
+    def test_solved_sketches_verify(self):
+        for seed in range(5):
+            hierarchy = infer_hierarchy(random_sketch(children=4, depth=3, framed_ratio=0.5, seed=seed))
+            hierarchy.solve()
+            verification = hierarchy.verify()
+            self.assertTrue(verification.ok)
+            self.assertLess(verification.worst, 1e-6)
+            self.assertEqual(len(verification.error), len(verification.views))
+
+    def test_reports_wrong_view(self):
+        hierarchy = infer_hierarchy(random_sketch(children=4, depth=2, seed=1))
+        hierarchy.solve()
+        leaf = hierarchy.flatlist()[0]
+        leaf.padding_constraint[0][0] += 0.3
+        self.assertTrue(hierarchy.verify(tolerance=0.5).ok)
+        failures = hierarchy.verify(tolerance=0.1).failures()
+        self.assertIn(leaf, [view for view, error in failures])
+        self.assertLessEqual(max(error for view, error in failures), 0.3 + 1e-9)
+
+    def test_stack(self):
+        root = View([0, 0], [100, 100], view_type=ViewType.VStack)
+        views = [root, View([10, 10], [30, 40]), View([35, 20], [60, 50]),
+                 View([70, 10], [90, 90], view_mode=ViewMode.Unframed)]
+        solver = ConstraintSolver(views)
+        solver.solve()
+        self.assertTrue(solver.verify())
+        views[2].frame_constraint[1] += 5
+        self.assertFalse(solver.verify())
+
+class TestStartup(unittest.TestCase):
+    def test_z3_loads_on_first_solve(self):
+        code = ('import sys, hierarchy, incremental, batch\n'
+                'assert "z3" not in sys.modules\n'
+                'hierarchy.solve_stack([hierarchy.View([0, 0], [10, 20], hierarchy.ViewType.HStack),'
+                ' hierarchy.View([0, 0], [10, 5]), hierarchy.View([0, 10], [10, 15])])\n'
+                'assert "z3" in sys.modules\n')
+        subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+class TestSketches(unittest.TestCase):
+    def test_reproducible_and_inferable(self):
+        for seed in range(5):
+            views = random_sketch(children=4, depth=3, seed=seed)
+            self.assertListEqual(views, random_sketch(children=4, depth=3, seed=seed))
+            hierarchy = infer_hierarchy(views)
+            self.assertEqual(len(hierarchy.flatlist()), len(views))
+
+class TestTraversal(unittest.TestCase):
+    def tree(self):
+        leaves = [View([0, i], [1, i + 1]) for i in range(4)]
+        inner = Hierarchy([0, 1], [1, 3], ViewType.HStack, children=leaves[1:3])
+        return Hierarchy([0, 0], [1, 4], ViewType.HStack, children=[leaves[0], inner, leaves[3]]), inner, leaves
+
+    def test_orders(self):
+        root, inner, leaves = self.tree()
+        self.assertEqual([view for view, depth in root.iter_dfs()], [root, leaves[0], inner] + leaves[1:])
+        self.assertEqual([view for view, depth in root.iter_bfs()],
+                         [root, leaves[0], inner, leaves[3], leaves[1], leaves[2]])
+        self.assertEqual([depth for view, depth in root.iter_bfs()], [0, 1, 1, 1, 2, 2])
+        self.assertEqual(list(root.iter_stacks()), [(root, 0), (inner, 1)])
+        self.assertEqual(root.flatlist(), leaves)
+
+    def test_empty(self):
+        self.assertEqual(Hierarchy([0, 0], [1, 1], children=[]).flatlist(), [])
+
+    def test_deep_tree(self):
+        # Deeper than the recursion limit
+        view = View([0, 0], [10, 10])
+        for i in range(1100):
+            view = Hierarchy([0, 0], [10, 10], ViewType(i % 2), children=[view, View([0, 0], [5, 5])])
+        self.assertEqual(len(view.flatlist()), 1101)
+        view.move([1, 2])
+        self.assertEqual(view.flatlist()[0].top_left, [1, 2])
+        self.assertEqual(view.to_swiftui().count('Stack('), 1100)
+        copy = view.deepcopy()
+        self.assertEqual(len(copy.stacks()), 1100)
+        self.assertEqual([leaf.top_left for leaf in copy.flatlist()], [leaf.top_left for leaf in view.flatlist()])
+        view.cleanse()
+
+class TestSwiftUI(unittest.TestCase):
+    def solved(self):
+        root = View([0, 0], [100, 100])
+        views = [root, View([10, 10], [40, 30]), View([10, 35], [40, 60], view_mode=ViewMode.Unframed),
+                 View([10, 70], [40, 80]), View([60, 10], [90, 90])]
+        hierarchy = infer_hierarchy(views)
+        hierarchy.solve()
+        return hierarchy
+
+    def test_output_unchanged(self):
+        expected = ('VStack(alignment: .leading, spacing: 20.0) {\nHStack(spacing: 5.0) {\nColor.black\n'
+                    '.frame(width: 20.0, height: 30.0)\nColor.black\nColor.black\n'
+                    '.frame(width: 10.0, height: 30.0)\n.padding(.leading, 5.0)\n}\n'
+                    '.frame(width: 70.0, height: 30.0)\n.padding(.horizontal, 10.0)\nColor.black\n'
+                    '.frame(width: 80.0, height: 30.0)\n.padding(.horizontal, 10.0)\n}')
+        self.assertEqual(self.solved().to_swiftui(), expected)
+
+    def test_write_matches_string(self):
+        hierarchy = self.solved()
+        sink = io.StringIO()
+        hierarchy.write_swiftui(sink, indent='    ')
+        self.assertEqual(sink.getvalue(), hierarchy.to_swiftui(indent='    '))
+
+    def test_indent(self):
+        lines = self.solved().to_swiftui(indent='  ').split('\n')
+        self.assertEqual(lines[1], '  HStack(spacing: 5.0) {')
+        self.assertEqual(lines[2], '    Color.black')
+        self.assertEqual(lines[-1], '}')
+        self.assertEqual(self.solved().to_swiftui(indent='  ').replace('  ', ''), self.solved().to_swiftui())
+
 # Testing constraint -> coord math
 class TestConstraints(unittest.TestCase):
     def test_padding_vstack(self):
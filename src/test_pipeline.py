@@ -0,0 +1,191 @@
+import unittest
+import io
+import json
+from batch import *
+from sketches import *
+from server import *
+from recording import *
+from sizes import *
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import sys
+import threading
+import urllib.request
+import urllib.error
+
+def sketch_dicts(seed):
+    '''A random sketch as the view dicts batch and server take.'''
+    return [view.to_dict() for view in random_sketch(children=3, depth=2, seed=seed)]
+
+class TestBatch(unittest.TestCase):
+    def test_jsonl_in_order(self):
+        lines = [json.dumps({'id': 'a', 'views': sketch_dicts(0)}), json.dumps(sketch_dicts(1))]
+        out = io.StringIO()
+        count = run(read_sketches(io.StringIO('\n'.join(lines))), out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(count, 2)
+        self.assertEqual([result['id'] for result in results], ['a', 1])
+        self.assertTrue(results[0]['swiftui'].endswith('}'))
+        self.assertEqual(results[0]['swiftui'], convert(sketch_dicts(0))['swiftui'])
+
+    def test_jsonl_of_view_lists(self):
+        for seeds in [[0, 1], [2]]:
+            text = '\n'.join(json.dumps(sketch_dicts(seed)) for seed in seeds)
+            out = io.StringIO()
+            self.assertEqual(run(read_sketches(io.StringIO(text)), out), len(seeds))
+            results = [json.loads(line) for line in out.getvalue().splitlines()]
+            self.assertEqual([result['swiftui'] for result in results],
+                             [convert(sketch_dicts(seed))['swiftui'] for seed in seeds])
+
+    def test_pool_matches_serial(self):
+        text = json.dumps([sketch_dicts(seed) for seed in range(4)])
+        serial, pooled = io.StringIO(), io.StringIO()
+        run(read_sketches(io.StringIO(text)), serial)
+        run(read_sketches(io.StringIO(text)), pooled, workers=2)
+        def swiftui(out):
+            return [json.loads(line)['swiftui'] for line in out.getvalue().splitlines()]
+        self.assertEqual(swiftui(serial), swiftui(pooled))
+
+    def test_errors_are_reported(self):
+        out = io.StringIO()
+        run(read_sketches(io.StringIO('[[{"top_left": [0, 0]}]]')), out)
+        self.assertIn('error', json.loads(out.getvalue()))
+
+class TestServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SolveServer(port=0, workers=2, batch_window=0.05)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, body):
+        request = urllib.request.Request(self.url + '/solve', data=json.dumps(body).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_solve_matches_batch(self):
+        result = self.post({'views': sketch_dicts(0)})
+        self.assertEqual(result['swiftui'], convert(sketch_dicts(0))['swiftui'])
+        hierarchy = infer_hierarchy([View.from_dict(view) for view in sketch_dicts(0)])
+        stacks = hierarchy.stacks()
+        self.assertEqual(len(result['constraints']), len(stacks))
+        for constraints, stack in zip(result['constraints'], stacks):
+            self.assertEqual(constraints['view_type'], stack.view_type.name)
+            self.assertEqual(len(constraints['children']), len(stack.children))
+
+    def test_concurrent_requests_use_every_worker(self):
+        dispatcher = self.server.dispatcher
+        batches = dispatcher.batches
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda seed: self.post(sketch_dicts(seed)), range(8)))
+        for seed, result in enumerate(results):
+            self.assertEqual(result['swiftui'], convert(sketch_dicts(seed))['swiftui'])
+        with urllib.request.urlopen(self.url + '/metrics') as response:
+            metrics = json.loads(response.read())
+        self.assertEqual(metrics['queue_depth'], 0)
+        # Split over both workers, never all 8 in one batch
+        self.assertGreaterEqual(metrics['batches'] - batches, 2)
+        self.assertLessEqual(max(dispatcher.batch_sizes), 4)
+        self.assertGreater(metrics['latency']['max'], 0)
+
+    def test_warm_worker_loads_z3(self):
+        code = ('import sys, server\n'
+                'server.warm_worker(8)\n'
+                'assert "z3" in sys.modules\n')
+        subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+    def test_bad_request(self):
+        with self.assertRaises(urllib.error.HTTPError) as e:
+            self.post({'nothing': []})
+        self.assertEqual(e.exception.code, 400)
+
+class TestRecording(unittest.TestCase):
+    def test_record_and_replay(self):
+        f = io.StringIO()
+        recorder = Recorder(f, [100, 100])
+        recorder.draw(View([10, 10], [40, 90]))
+        recorder.draw(View([50, 10], [60, 90], view_mode=ViewMode.Unframed))
+        recorder.draw(View([70, 10], [95, 90]))
+        recorder.undo()
+        views = [View([0, 0], [100, 100]), View([10, 10], [40, 90]),
+                 View([50, 10], [60, 90], view_mode=ViewMode.Unframed)]
+        recorder.snap(views)
+        recorder.submit(views)
+        events = list(read_recording(io.StringIO(f.getvalue())))
+        self.assertEqual([event['event'] for event in events],
+                         ['start', 'draw', 'draw', 'draw', 'undo', 'snap', 'submit'])
+        results = replay(events)
+        self.assertEqual([(result['step'], result['event'], result['views']) for result in results],
+                         [(5, 'snap', 2), (6, 'submit', 2)])
+        self.assertEqual(set(results[0]['seconds']), {'infer', 'cleanse'})
+        self.assertEqual(set(results[1]['seconds']), {'infer', 'solve', 'to_swiftui'})
+        self.assertEqual(results[1]['status'], 'Optimal')
+        self.assertEqual(summary(results)['submit']['steps'], 1)
+
+    def test_replay_without_view_lists(self):
+        events = [{'t': 0, 'event': 'start', 'dimensions': [100, 100]},
+                  {'t': 1, 'event': 'draw', 'view': [10, 10, 40, 90, 1]},
+                  {'t': 2, 'event': 'draw', 'view': [50, 10, 90, 90, 1]},
+                  {'t': 3, 'event': 'snap'},
+                  {'t': 4, 'event': 'submit'}]
+        self.assertEqual([result['views'] for result in replay(events)], [2, 2])
+
+class TestSizes(unittest.TestCase):
+    def sketch(self):
+        root = View([0, 0], [100, 100])
+        return infer_hierarchy([root, View([10, 10], [30, 90]), View([40, 10], [60, 90]),
+                                View([70, 20], [90, 40], view_mode=ViewMode.Unframed), View([70, 60], [90, 80])])
+
+    def frames(self, hierarchy):
+        return [value for index, name, value in constraint_values(hierarchy) if name.startswith('frame')]
+
+    def test_layouts_share_frames(self):
+        hierarchy = self.sketch()
+        layouts = solve_sizes(hierarchy, [[100, 100], [150, 80], [300, 200]])
+        self.assertEqual([layout.separate for layout in layouts], [0, 0, 0])
+        for layout in layouts:
+            self.assertEqual(layout.status, SolveStatus.Optimal)
+            self.assertEqual(layout.hierarchy.size(0), layout.size[0])
+            self.assertTrue(layout.hierarchy.verify().ok)
+            self.assertEqual(self.frames(layout.hierarchy), self.frames(hierarchy))
+        self.assertEqual(layouts[0].to_swiftui(), hierarchy.to_swiftui())
+
+    def test_joint_solve_reframes(self):
+        # Solved alone, the wide child is framed and does not fit 60 points
+        root = View([0, 0], [50, 100])
+        hierarchy = infer_hierarchy([root, View([0, 0], [50, 10], view_mode=ViewMode.Unframed),
+                                     View([0, 10], [50, 90], view_mode=ViewMode.Unframed),
+                                     View([0, 90], [50, 100], view_mode=ViewMode.Unframed)])
+        layouts = solve_sizes(hierarchy, [[50, 60], [50, 100]])
+        self.assertEqual([child.frame_constraint[1] for child in hierarchy.children], [10, 0, 10])
+        self.assertTrue(hierarchy.verify().ok)
+        for layout in layouts:
+            self.assertEqual(layout.separate, 0)
+            self.assertTrue(layout.hierarchy.verify().ok)
+            self.assertEqual(self.frames(layout.hierarchy), self.frames(hierarchy))
+
+    def test_too_small_is_solved_separately(self):
+        hierarchy = self.sketch()
+        layouts = solve_sizes(hierarchy, [[100, 40]])
+        self.assertGreater(layouts[0].separate, 0)
+        self.assertTrue(layouts[0].hierarchy.verify().ok)
+
+    def test_report(self):
+        layouts = solve_sizes(self.sketch(), [[100, 100], [100, 80], [100, 200]])
+        report = size_report(layouts)
+        self.assertTrue(report)
+        for entry in report:
+            self.assertTrue(entry['constraint'].startswith('padding'))
+            self.assertEqual(len(set(entry['values'])), 2)
+            # Only the narrower size has to give up padding
+            self.assertEqual(entry['values'][0], entry['values'][2])
+
+if __name__ == '__main__':
+    unittest.main()
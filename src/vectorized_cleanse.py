@@ -0,0 +1,130 @@
+'''Vectorized Hierarchy.cleanse, selected with cleanse(vectorized=True).
+
+Size and gap grouping are greedy, so the order views are visited in still
+decides the groups, and that one decision per view stays a loop. Picking the
+nearest group, enforcing group sizes, laying out the major axis and
+snapping centers are array operations over all children at once. Group
+means are updated with the same float operations as Hierarchy.size_group,
+so the snapped layout matches the default engine up to rounding in the
+running sums.
+'''
+from view import *
+from hierarchy import Hierarchy
+import numpy as np
+
+# Same as Hierarchy.cleanse
+SIZE_TOLERANCE = .2
+POS_TOLERANCE = .2
+CENTER_TOLERANCE = .2
+
+def size_groups(sizes, tolerance):
+    '''Greedily groups sizes like Hierarchy.size_group. Returns the group
+    members, their means and the order the groups end up sorted in.
+    '''
+    means = []
+    totals = []
+    members = []
+    order = np.empty(0, dtype=int)
+    for k, size in enumerate(sizes):
+        if len(means) > 0:
+            order = order[np.argsort(np.abs(np.asarray(means)[order] - size), kind='stable')]
+            best = order[0]
+            count = len(members[best])
+            # size_group.can_append appends, checks, then pops
+            mean = means[best]
+            mean *= count / (count + 1)
+            mean += size / (count + 1)
+            newmean = (totals[best] + size) / (count + 1)
+            if newmean == 0:
+                # can_append returns before popping in this case
+                means[best] = mean
+                totals[best] += size
+                members[best].append(k)
+            else:
+                valid = abs((newmean - size) / mean) < tolerance
+                mean -= size / (count + 1)
+                mean *= (count + 1) / count
+                means[best] = mean
+                if valid:
+                    mean *= count / (count + 1)
+                    mean += size / (count + 1)
+                    means[best] = mean
+                    totals[best] += size
+                    members[best].append(k)
+                    continue
+        means.append(size)
+        totals.append(size)
+        members.append([k])
+        order = np.append(order, len(means) - 1)
+    return members, means, order
+
+def gap_groups(dists, tolerance):
+    '''Puts each gap in the first group whose mean is within tolerance and
+    returns every gap replaced by its group's mean.
+    '''
+    totals = np.zeros(len(dists))
+    counts = np.zeros(len(dists))
+    group_of = np.zeros(len(dists), dtype=int)
+    groups = 0
+    for i, dist in enumerate(dists):
+        if groups > 0:
+            means = totals[:groups] / counts[:groups]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fits = (means != 0) & (np.abs((means - dist) / means) < tolerance)
+            if fits.any():
+                group = int(np.argmax(fits))
+                totals[group] += dist
+                counts[group] += 1
+                group_of[i] = group
+                continue
+        totals[groups] = dist
+        counts[groups] = 1
+        group_of[i] = groups
+        groups += 1
+    return (totals[:groups] / counts[:groups])[group_of]
+
+def cleanse_level(hierarchy):
+    children = hierarchy.children
+    if len(children) == 0:
+        return
+    # agree on size, leaves only as in Hierarchy.cleanse
+    leaves = [view for view in children if not isinstance(view, Hierarchy)]
+    for axis in [0, 1]:
+        tops = np.array([view.top_left[axis] for view in leaves])
+        bots = np.array([view.bot_right[axis] for view in leaves])
+        members, means, order = size_groups((bots - tops).tolist(), SIZE_TOLERANCE)
+        for group in order:
+            bots[members[group]] = tops[members[group]] + means[group]
+        for view, bot in zip(leaves, bots.tolist()):
+            view.bot_right[axis] = bot
+
+    # snap position along the major axis
+    major_axis = int(hierarchy.view_type)
+    tops = np.array([view.top_left[major_axis] for view in children])
+    bots = np.array([view.bot_right[major_axis] for view in children])
+    dists = gap_groups((tops[1:] - bots[:-1]).tolist(), POS_TOLERANCE)
+    steps = np.empty(2 * (len(children) - 1))
+    steps[0::2] = (bots - tops)[:-1]
+    steps[1::2] = dists
+    # cumsum adds left to right like the running sum in Hierarchy.cleanse
+    running = np.cumsum(np.concatenate([[tops[0]], steps]))[2::2]
+    for view, diff in zip(children[1:], (running - tops[1:]).tolist()):
+        move = [0, 0]
+        move[major_axis] = diff
+        view.move(move)
+
+    # snap centers along the minor axis
+    minor_axis = (major_axis + 1) % 2
+    center = (hierarchy.top_left[minor_axis] + hierarchy.bot_right[minor_axis]) / 2
+    centers = np.array([view.center(minor_axis) for view in children])
+    snap = np.abs(center - centers) / hierarchy.size(minor_axis) < CENTER_TOLERANCE
+    diffs = np.where(snap, center - centers, 0)
+    for view, diff in zip(children, diffs.tolist()):
+        move = [0, 0]
+        move[minor_axis] = diff
+        view.move(move)
+
+def cleanse(hierarchy):
+    '''Cleanses every level of hierarchy, parents first.'''
+    for stack, depth in hierarchy.iter_stacks():
+        cleanse_level(stack)
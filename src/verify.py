@@ -0,0 +1,110 @@
+'''Checks solved hierarchies by laying them out again from their constraints.
+
+Every child is placed inside its parent's drawn box the way
+ConstraintSolver.optimize places it: frames of 0 share what is left along
+the major axis, a stack with none of those is centered, and the minor axis
+follows the parent's alignment unless the child has no frame there. All
+stacks are laid out together, as array operations over every view at once,
+so checking a whole screen costs about as much as checking one stack.
+'''
+from view import *
+from hierarchy import Hierarchy
+from store import ViewStore, preorder
+import numpy as np
+
+# Points a reconstructed edge may be off by, solutions are rounded to 0.1
+TOLERANCE = 0.5
+
+def reconstruct(store):
+    '''Coordinates of every view of a ViewStore as its constraints lay it out.
+    The root keeps its drawn box.
+    '''
+    coords = store.coords.copy()
+    children = np.flatnonzero(store.parent >= 0)
+    if len(children) == 0:
+        return coords
+    # Group children by parent, keeping their order within each stack
+    ids = children[np.argsort(store.parent[children], kind='stable')]
+    parent = store.parent[ids]
+    rows = np.arange(len(ids))
+    major = store.view_type[parent].astype(int)
+    minor = 1 - major
+    box = store.coords[parent]
+    pre = store.padding[ids, :, 0]
+    post = store.padding[ids, :, 1]
+    frame = store.frame[ids]
+    spacing = store.spacing[parent]
+
+    def per_stack(values):
+        return np.bincount(parent, weights=values, minlength=len(store))[parent]
+
+    # Major axis
+    free_count = per_stack((frame[rows, major] == 0).astype(float))
+    taken = per_stack(pre[rows, major] + post[rows, major] + frame[rows, major])
+    count = per_stack(np.ones(len(ids)))
+    free = box[rows, 1, major] - box[rows, 0, major] - spacing * (count - 1) - taken
+    fsize = np.where(free_count > 0, free / np.maximum(free_count, 1), 0)
+    size = np.where(frame[rows, major] == 0, fsize, frame[rows, major])
+    start = box[rows, 0, major] + np.where(free_count > 0, 0, free / 2)
+    extent = pre[rows, major] + size + post[rows, major] + spacing
+    # Everything before each child in its own stack
+    total = np.cumsum(extent)
+    first = np.r_[True, parent[1:] != parent[:-1]]
+    offset = np.maximum.accumulate(np.where(first, rows, 0))
+    before = total - extent - (total - extent)[offset]
+    top = start + before + pre[rows, major]
+    coords[ids, 0, major] = top
+    coords[ids, 1, major] = top + size
+
+    # Minor axis
+    lead = box[rows, 0, minor] + pre[rows, minor]
+    trail = box[rows, 1, minor] - post[rows, minor]
+    width = frame[rows, minor]
+    alignment = store.alignment[parent]
+    aligned = np.select([alignment == 0, alignment == 1],
+                        [lead, lead + (trail - lead - width) / 2], trail - width)
+    unframed = width == 0
+    coords[ids, 0, minor] = np.where(unframed, lead, aligned)
+    coords[ids, 1, minor] = np.where(unframed, trail, aligned + width)
+    return coords
+
+class Verification:
+    '''How far every view of a solved hierarchy lands from where it was drawn
+    when laid out from its constraints. Views are listed in ViewStore id
+    order, error[i] is the largest distance of any edge of views[i].
+    '''
+    def __init__(self, hierarchy, tolerance=TOLERANCE):
+        self.views, parents = preorder(hierarchy)
+        self.store = ViewStore.from_preorder(self.views, parents)
+        self.coords = reconstruct(self.store)
+        self.error = np.abs(self.coords - self.store.coords).max(axis=(1, 2))
+        self.tolerance = tolerance
+
+    @property
+    def ok(self):
+        return bool((self.error <= self.tolerance).all())
+
+    @property
+    def worst(self):
+        return float(self.error.max())
+
+    def failures(self):
+        '''(view, error) of every view off by more than the tolerance.'''
+        return [(self.views[i], float(self.error[i])) for i in np.flatnonzero(self.error > self.tolerance)]
+
+def verify(hierarchy, tolerance=TOLERANCE):
+    return Verification(hierarchy, tolerance)
+
+def verify_stack(views, tolerance=TOLERANCE):
+    '''Verifies one solved stack given as [root] + children.'''
+    def detached(view):
+        # Only this level is checked, not what is nested in child stacks
+        leaf = View(view.top_left, view.bot_right, view_mode=view.view_mode)
+        leaf.frame_constraint = view.frame_constraint
+        leaf.padding_constraint = view.padding_constraint
+        return leaf
+    root = views[0]
+    stack = Hierarchy(root.top_left, root.bot_right, root.view_type, children=[detached(view) for view in views[1:]])
+    stack.alignment = root.alignment
+    stack.spacing_constraint = root.spacing_constraint
+    return Verification(stack, tolerance)
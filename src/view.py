@@ -18,6 +18,10 @@ class ViewMode(Flag):
         return "framed" if self else "unframed"
 
 class View:
+    # Screens can hold thousands of views, slots keep each one small
+    __slots__ = ('top_left', 'bot_right', 'view_type', 'view_mode', 'spacing_constraint',
+                 'padding_constraint', 'frame_constraint', 'alignment')
+
     def __init__(self, top_left, bot_right, view_type=ViewType.Leaf, view_mode=ViewMode.Framed):
         self.top_left = top_left
         self.bot_right = bot_right
@@ -65,8 +69,18 @@ class View:
     def gen_frame(self, height=None, width=None):
         self.frame_constraint = [height, width]
 
+    def to_dict(self):
+        return {'top_left': self.top_left, 'bot_right': self.bot_right,
+                'view_mode': str(self.view_mode)}
+
+    @staticmethod
+    def from_dict(d):
+        '''Reads a view written by to_dict. view_mode defaults to framed.'''
+        view_mode = ViewMode.Unframed if d.get('view_mode') == str(ViewMode.Unframed) else ViewMode.Framed
+        return View(list(d['top_left']), list(d['bot_right']), view_mode=view_mode)
+
     def deepcopy(self):
-        return View(deepcopy(self.top_left), deepcopy(self.bot_right), self.view_type)
+        return View(deepcopy(self.top_left), deepcopy(self.bot_right), self.view_type, self.view_mode)
 
     def move(self, diff):
         '''Moves top left to new top_left, changing bot_right as well as children
@@ -86,31 +100,46 @@ class View:
             for j in range(2):
                 self.padding_constraint[i][j] = round(self.padding_constraint[i][j], 1)
 
-    def to_swiftui(self):
-        self.truncate_values()
+    def swiftui_modifiers(self, prefix=''):
+        '''Yields the frame and padding modifiers, each on its own line.'''
         fargs = []
         if self.is_framed(1):
             fargs.append("width: " + str(self.frame_constraint[1]))
         if self.is_framed(0):
             fargs.append("height: " + str(self.frame_constraint[0]))
-        frame = (f"\n.frame({', '.join(fargs)})") if len(fargs) > 0 else ""
+        if len(fargs) > 0:
+            yield f"\n{prefix}.frame({', '.join(fargs)})"
 
-        padstr = ""
         padding = self.padding_constraint
         if padding[0][0] == padding[0][1] and padding[0][0] > 0:
-            padstr += f"\n.padding(.vertical, {padding[0][0]})"
+            yield f"\n{prefix}.padding(.vertical, {padding[0][0]})"
         else:
             if padding[0][0] > 0:
-                padstr += f"\n.padding(.top, {padding[0][0]})"
+                yield f"\n{prefix}.padding(.top, {padding[0][0]})"
             if padding[0][1] > 0:
-                padstr += f"\n.padding(.bottom, {padding[0][1]})"
+                yield f"\n{prefix}.padding(.bottom, {padding[0][1]})"
 
         if padding[1][0] == padding[1][1] and padding[1][0] > 0:
-            padstr += f"\n.padding(.horizontal, {padding[1][0]})"
+            yield f"\n{prefix}.padding(.horizontal, {padding[1][0]})"
         else:
             if padding[1][0] > 0:
-                padstr += f"\n.padding(.leading, {padding[1][0]})"
+                yield f"\n{prefix}.padding(.leading, {padding[1][0]})"
             if padding[1][1] > 0:
-                padstr += f"\n.padding(.trailing, {padding[1][1]})"
+                yield f"\n{prefix}.padding(.trailing, {padding[1][1]})"
+
+    def iter_swiftui(self, indent='', depth=0):
+        '''Yields the SwiftUI for this view piece by piece, so it can be streamed
+        without building the whole string. Every line is prefixed with indent
+        once per level of nesting.
+        '''
+        self.truncate_values()
+        yield indent * depth + VIEW_DEFAULT
+        yield from self.swiftui_modifiers(indent * depth)
+
+    def write_swiftui(self, sink, indent=''):
+        '''Writes the SwiftUI to anything with a write method.'''
+        for token in self.iter_swiftui(indent):
+            sink.write(token)
 
-        return VIEW_DEFAULT + frame + padstr
+    def to_swiftui(self, indent=''):
+        return ''.join(self.iter_swiftui(indent))